@@ -1,5 +1,7 @@
 # config.py
 
+import re
+
 # Plotting configuration parameters
 PLOTTING_CONFIG = {
     'baseline_duration': 20,  # in minutes
@@ -9,13 +11,18 @@ PLOTTING_CONFIG = {
     'fit_window_end': 1       # in minutes before trial start
 }
 
+# Patterns are compiled once here so renaming never re-compiles per column
 RENAME_PATTERNS = [
-    ('bonsai', {"pattern": "(CombiTimestamps)?_\\d+_?[AB].?", "replacement": ""}),
-    ('bonsai', {"pattern": "FP3002_Timestamp", "replacement": "Timestamp_FP3002"}),
-    ('bonsai', {"pattern": "TimestampBonsai", "replacement": "Timestamp_Bonsai"})
+    ('bonsai', {"pattern": re.compile("(CombiTimestamps)?_\\d+_?[AB].?"), "replacement": ""}),
+    ('bonsai', {"pattern": re.compile("FP3002_Timestamp"), "replacement": "Timestamp_FP3002"}),
+    ('bonsai', {"pattern": re.compile("TimestampBonsai"), "replacement": "Timestamp_Bonsai"})
 ]
 LETTER_TO_FREQS = {'iso': '415', 'G': '470', 'R': '560'}
 
+# Parse photometry channel columns as float32; halves memory and bandwidth,
+# and the downstream means/stds are fine in single precision
+DOWNCAST = True
+
 all_brain_regions = ['VS', 'DLS']
 
 # self.dfs.add_data('phot', phot_df)
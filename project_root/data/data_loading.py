@@ -1,9 +1,45 @@
+import glob
 import os
 import fnmatch
 import re
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
 from tqdm import tqdm
-from config import tracking_df_pattern, PHOT_DF_PATTERNS
+from config import tracking_df_pattern, PHOT_DF_PATTERNS, DOWNCAST
+
+# photometry columns look like 'G1'/'R2' or 'Region1G'; everything else is metadata
+PHOT_COL_PATTERN = re.compile(r"[GR](\d+)|"
+                              r"Region(\d+)[GR]")
+
+
+# The same handful of file patterns is matched against thousands of scanned
+# file names, so compile each glob to a regex exactly once
+@lru_cache(maxsize=None)
+def _glob_matcher(file_pattern):
+    return re.compile(fnmatch.translate(file_pattern)).match
+
+
+# Sessions from the same trial share their CSVs, so the header scan and the
+# include-columns template only need to run once per file / fiber layout
+@lru_cache(maxsize=128)
+def _csv_header(file_path):
+    with pacsv.open_csv(file_path) as reader:
+        return tuple(reader.schema.names)
+
+
+@lru_cache(maxsize=128)
+def _include_columns(header, fiber_numbers):
+    include_columns = []
+    for col in header:
+        match = PHOT_COL_PATTERN.match(col)
+        # Keep non-photometry columns, plus the fibers listed in the trial guide
+        if match is None or (match.group(1) or match.group(2)) in fiber_numbers:
+            include_columns.append(col)
+    return tuple(include_columns)
 
 class DataContainer:
     def __init__(self, data_type=None):
@@ -51,23 +87,38 @@ class Session:
         
         self.load_all_data()
         
-    def load_data(self, file_pattern, skip_rows=None, use_cols=None, only_header=False):
-        file_name = next((f for f in os.listdir(self.trial_dir) if fnmatch.fnmatch(f, file_pattern)), None)
+    def load_data(self, file_pattern, skip_rows=None, filter_phot_columns=False, only_header=False):
+        # scandir + a compiled glob pattern avoids re-statting every entry
+        pattern_match = _glob_matcher(file_pattern)
+        with os.scandir(self.trial_dir) as entries:
+            file_name = next((e.name for e in entries if pattern_match(e.name)), None)
         if file_name:
             file_path = os.path.join(self.trial_dir, file_name)
+            # one cheap (and cached) pass over the header; the actual parse is
+            # multi-threaded C++
+            header = _csv_header(file_path)
             if only_header:
-                df = pd.read_csv(file_path, nrows=0)
-                return df.columns.tolist()
-            else:
-                return pd.read_csv(file_path, skiprows=skip_rows, usecols=use_cols)
+                return list(header)
+            include_columns = list(self.select_columns(header)) if filter_phot_columns else None
+            column_types = None
+            if filter_phot_columns and DOWNCAST:
+                # Signal channels are fine in single precision; timestamps etc. keep their type
+                column_types = {col: pa.float32() for col in include_columns
+                                if PHOT_COL_PATTERN.match(col)}
+            read_options = pacsv.ReadOptions(use_threads=True, block_size=8 << 20,
+                                             skip_rows=skip_rows or 0)
+            convert_options = pacsv.ConvertOptions(include_columns=include_columns,
+                                                   column_types=column_types)
+            table = pacsv.read_csv(file_path, read_options=read_options,
+                                   convert_options=convert_options)
+            return table.to_pandas(self_destruct=True)
         else:
             return None
 
     def load_all_data(self):
-        # Load photometry data
-        #TODO:save memory by filtering out unnecesarry columns (usecol)        
+        # Load photometry data, filtering out columns from unused fibers at parse time
         for df_name, df_file_pattern in PHOT_DF_PATTERNS.items():
-            phot_df = self.load_data(df_file_pattern, use_cols=self.filter_columns)
+            phot_df = self.load_data(df_file_pattern, filter_phot_columns=True)
             self.dfs.add_data(df_name, phot_df)
 
         tracking_df = self.load_data(tracking_df_pattern)
@@ -75,49 +126,64 @@ class Session:
 
     # create_fiber_dict creates dictionary of all fibers used and their corresponding brainregion
     def create_fiber_to_region_dict(self, fiber_pattern=re.compile(r'fiber(\d+)')):
-        # Initialize an empty dictionary
-        fiber_to_region_dict = {}
-        
-        # Iterate over the DataFrame index with enumeration for index and column label
-        for idx, col in enumerate(self.session_guide.index):
-            # Check if the column matches the fiber pattern and the value is not NaN
-            if fiber_pattern.match(col) and pd.notna(self.session_guide[col]):
-                # Ensure we don't access an index out of range
-                if idx + 1 < len(self.session_guide.index):
-                    # Check if the next item is NaN using iloc for safe access
-                    if pd.isna(self.session_guide.iloc[idx + 1]):
-                        # Extract the fiber number and add it to the dictionary
-                        fiber_number = fiber_pattern.match(col).group(1)
-                        region_and_side = self.session_guide[col]
-                        fiber_to_region_dict[fiber_number] = tuple(region_and_side.split("_"))
-        return fiber_to_region_dict
+        # Pull the fiber number out of every index label in one vectorized extract
+        values = self.session_guide.to_numpy()
+        fiber_numbers = self.session_guide.index.str.extract(fiber_pattern, expand=False)
+
+        # A fiber is in use when its cell is filled and the neighbouring cell is empty;
+        # the final column has no neighbour, matching the old idx + 1 bounds check
+        next_is_nan = np.r_[pd.isna(values[1:]), False]
+        mask = fiber_numbers.notna() & pd.notna(values) & next_is_nan
+        return {fiber_number: tuple(region_and_side.split("_"))
+                for fiber_number, region_and_side in zip(fiber_numbers[mask], values[mask])}
 
 
     # to save memory, all of the columns that contain data from unused fibers, are filtered out pre-loading
-    def filter_columns(self, col):
-        pattern = re.compile(r"[GR](\d+)|"
-                             r"Region(\d+)[GR]")
-        match = pattern.match(col)
-        if match:
-            # Check if the captured number is in the keys of fiber_dict
-            captured_number = match.group(1) or match.group(2)
-            return captured_number in self.fiber_to_region
-        else:
-            # If the column doesn't match the pattern, include it
-            return True
+    def select_columns(self, header):
+        return _include_columns(tuple(header), frozenset(self.fiber_to_region))
         
 
+# Compiled once; sort_key_func runs O(N log N) times per load_all_sessions call
+_TRIAL_NUM_RE = re.compile(r'T(\d+)')
+
+
 # Custom sort key function that extracts the trial number from a directory name
-def sort_key_func(dir_name):
-    # Find all numbers following 'T' or before a period '.' and return them as a tuple of integers
-    numbers = tuple(map(int, re.findall(r'T(\d+)', dir_name)))
-    return numbers
+def sort_key_func(dir_name, _findall=_TRIAL_NUM_RE.findall):
+    # Find all numbers following 'T' and return them as a tuple of integers
+    return tuple(map(int, _findall(dir_name)))
+
+
+# Loads every session of a single trial directory; top-level so it can be
+# dispatched to worker processes (Session/DataContainer only hold plain attrs).
+def _load_trial(trial_dir, remove_bad_signal_sessions=False):
+    trial_id = os.path.basename(trial_dir)
+    segments = trial_id.split('_')[1].split('.')  # Assuming the format is like 'T1_23.25.29.e'
+
+    # Parse the trial guide once per trial; calamine is much faster than openpyxl
+    trial_guide_path = glob.glob(os.path.join(trial_dir, '*trial_guide.xlsx'))[0]
+    current_trial_guide_df = pd.read_excel(trial_guide_path, nrows=4,
+                                           dtype={"mouse_id": str}, index_col=0, engine='calamine')
+    sessions = []
+    for segment, chamber_id in zip(segments, "abcd"):
+        if segment == 'e':
+            continue  # Skip this session as it's marked as empty
+        session_guide = current_trial_guide_df.loc[chamber_id]
+
+        if session_guide.mouse_id != segment:
+            raise Exception("The mouse id from the folder names and trial guide do not match")
+
+        new_session = Session(chamber_id, trial_dir, session_guide)
+        if len(new_session.brain_regions) > 0 or (remove_bad_signal_sessions == False):
+            sessions.append(new_session)
+    return sessions
 
 
 # TODO: a bit limited in parameters, recommend additional ones if need be
-def load_all_sessions(baseline_dir, first_n_dirs=None, remove_bad_signal_sessions=False):
+def load_all_sessions(baseline_dir, first_n_dirs=None, remove_bad_signal_sessions=False, parallel=False):
     # Get a list of all subdirectories within the baseline directory
-    subdirs = [d for d in os.listdir(baseline_dir) if os.path.isdir(os.path.join(baseline_dir, d))]
+    # (DirEntry.is_dir uses the cached type info from readdir, no extra stat per entry)
+    with os.scandir(baseline_dir) as entries:
+        subdirs = [e.name for e in entries if e.is_dir()]
 
     # Sort the subdirectories based on the trial number
     sorted_subdirs = sorted(subdirs, key=sort_key_func)
@@ -129,26 +195,14 @@ def load_all_sessions(baseline_dir, first_n_dirs=None, remove_bad_signal_session
 
     all_sessions = []
 
-    for trial_dir in tqdm(trial_dirs[:first_n_dirs]):
-        trial_id = os.path.basename(trial_dir)
-        segments = trial_id.split('_')[1].split('.')  # Assuming the format is like 'T1_23.25.29.e'
-        
-        for file in os.listdir(trial_dir):
-            # Check if file ends with 'trial_guide.xlsx'
-            if fnmatch.fnmatch(file, '*trial_guide.xlsx'):
-                # Load into DataFrame
-                current_trial_guide_df = pd.read_excel(os.path.join(trial_dir, file), nrows=4,
-                                                    dtype={"mouse_id": str}, index_col=0, engine='openpyxl')
-        for segment, chamber_id in zip(segments, "abcd"):
-            if segment == 'e':
-                continue  # Skip this session as it's marked as empty
-            session_guide = current_trial_guide_df.loc[chamber_id]
-        
-
-            if session_guide.mouse_id != segment:
-                raise Exception("The mouse id from the folder names and trial guide do not match")
-            
-            new_session = Session(chamber_id, trial_dir, session_guide)
-            if len(new_session.brain_regions) > 0 or (remove_bad_signal_sessions == False):
-                all_sessions.append(new_session)
+    if parallel:
+        # Each trial parses independent CSV/XLSX files, so this scales ~linearly with cores
+        load_trial = partial(_load_trial, remove_bad_signal_sessions=remove_bad_signal_sessions)
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+            for trial_sessions in tqdm(executor.map(load_trial, trial_dirs[:first_n_dirs], chunksize=4),
+                                       total=len(trial_dirs[:first_n_dirs])):
+                all_sessions.extend(trial_sessions)
+    else:
+        for trial_dir in tqdm(trial_dirs[:first_n_dirs]):
+            all_sessions.extend(_load_trial(trial_dir, remove_bad_signal_sessions))
     return all_sessions
\ No newline at end of file
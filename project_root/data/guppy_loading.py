@@ -2,19 +2,26 @@ import os
 import h5py
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 import re
-import matplotlib.ticker as ticker
 
 def list_folders(directory):
-    # Get a list of all entries in the directory
-    entries = os.listdir(directory)
-    
-    # Filter the list to include only directories
-    folders = [entry for entry in entries if os.path.isdir(os.path.join(directory, entry))]
+    # scandir's DirEntry caches the entry type, so no extra stat call per entry
+    with os.scandir(directory) as entries:
+        folders = [entry.name for entry in entries if entry.is_dir()]
     folders = sorted(folders)
     return folders
 
+def _walk_datasets(group, prefix, out):
+    # Explicit walk instead of visititems: no Python callback per node and no
+    # repeated object-reference resolution inside h5py
+    for name, obj in group.items():
+        path = f"{prefix}/{name}" if prefix else name
+        if isinstance(obj, h5py.Dataset):
+            out.append((path, obj))
+        else:
+            _walk_datasets(obj, path, out)
+
+
 def load_hdf5_file(file_path):
     """
     Load all datasets from an HDF5 file into a single DataFrame.
@@ -25,21 +32,22 @@ def load_hdf5_file(file_path):
     Returns:
     - df: pandas DataFrame containing all datasets as columns
     """
-    data_dict = {}
-    
-    def extract_datasets(name, obj):
-        if isinstance(obj, h5py.Dataset):
-            key = name.decode() if isinstance(name, bytes) else name
-            data_dict[key] = np.array(obj).flatten() if len(obj.shape) > 1 else np.array(obj)
+    # enlarged chunk cache so chunked datasets are not re-read per access
+    with h5py.File(file_path, 'r', rdcc_nbytes=16 << 20) as file:
+        datasets = []
+        _walk_datasets(file, '', datasets)
+        # dset[()] reads each dataset in one call instead of going through
+        # h5py's element slicing path
+        data_dict = {}
+        for key, dset in datasets:
+            arr = dset[()]
+            data_dict[key] = arr.reshape(-1) if arr.ndim > 1 else arr
     
-    with h5py.File(file_path, 'r') as file:
-        file.visititems(extract_datasets)
-    
-    # Create DataFrame from dictionary, padding with NaNs for unequal lengths
-    max_len = max(len(v) for v in data_dict.values())
-    df = pd.DataFrame({k: pd.Series(v).reindex(range(max_len), fill_value=np.nan) for k, v in data_dict.items()})
-    
-    return df
+    # Pad shorter arrays with NaNs directly instead of a Series/reindex round-trip per key
+    max_len = max(map(len, data_dict.values()))
+    padded = {k: np.concatenate([v, np.full(max_len - len(v), np.nan)]) if len(v) < max_len else v
+              for k, v in data_dict.items()}
+    return pd.DataFrame(padded, copy=False)
 
 def load_h5_file(file_path, key):
     """
@@ -69,9 +77,12 @@ def list_files_and_load_data(directory_path):
     """
     all_data = {}
 
-    for filename in os.listdir(directory_path):
+    with os.scandir(directory_path) as entries:
+        file_names = [e.name for e in entries if e.is_file()]
+
+    for filename in file_names:
         file_path = os.path.join(directory_path, filename)
-        
+
         if filename.endswith(".hdf5"):
             #print(f"Processing HDF5 file: {filename}")
             data_dict = load_hdf5_file(file_path)
@@ -79,11 +90,11 @@ def list_files_and_load_data(directory_path):
         
         elif filename.endswith(".h5"):
             #print(f"Processing H5 file: {filename}")
-            with h5py.File(file_path, 'r') as file:
-                keys = list(file.keys())
-                for key in keys:
-                    df = load_h5_file(file_path, key)
-                    all_data[f"{filename}_{key}"] = df
+            # Open the store once and read every key from the same handle,
+            # instead of re-opening the file per key via pd.read_hdf
+            with pd.HDFStore(file_path, mode='r') as store:
+                for key in store.keys():
+                    all_data[f"{filename}_{key.strip('/')}"] = store.select(key)
     
     return all_data
 
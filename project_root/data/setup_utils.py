@@ -1,9 +1,16 @@
 import re
+from config import LETTER_TO_FREQS
+
+# One compiled region pattern per channel letter, shared across sessions and columns
+_REGION_PATTERNS = {letter: re.compile(r'Region(\d+)' + ('' if letter == 'iso' else letter))
+                    for letter in LETTER_TO_FREQS}
 
 class Renamer:
     @staticmethod
     def rename_df_columns(df, pattern, replacement):
-        df.rename(columns=lambda x: re.sub(pattern, replacement, x), inplace=True)
+        # re.compile is a no-op on an already-compiled pattern
+        pattern = re.compile(pattern)
+        df.rename(columns=lambda x: pattern.sub(replacement, x), inplace=True)
 
     @staticmethod
     def rename_sessions_data(sessions, patterns):
@@ -19,9 +26,7 @@ class Renamer:
     
     @staticmethod
     def extract_region_number(column_name, letter):
-        if letter == 'iso':
-            letter = ''
-        match = re.search(r'Region(\d+)' + letter, column_name)
+        match = _REGION_PATTERNS[letter].search(column_name)
         return match.group(1) if match else None
 
     @staticmethod
@@ -1,6 +1,43 @@
 import numpy as np
 from config import LETTER_TO_FREQS
 
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _dff_kernel(phot, iso, fit_start, fit_end, plot_start, plot_end):
+        # Same arithmetic as the NumPy path in calculate_dff, fused into
+        # reduction passes plus one parallel arithmetic pass over the array
+        n = phot.shape[0]
+        mean_diff = np.mean(phot[fit_start:fit_end]) - np.mean(iso[fit_start:fit_end])
+
+        diff = np.empty(n, dtype=phot.dtype)
+        for k in prange(n):
+            diff[k] = (phot[k] - iso[k]) + mean_diff
+        min_positive = abs(np.min(diff[plot_start:plot_end]))
+
+        fit_n = fit_end - fit_start
+        fit_mean = 0.0
+        for k in range(fit_start, fit_end):
+            fit_mean += diff[k] + min_positive
+        fit_mean /= fit_n
+        fit_var = 0.0
+        for k in range(fit_start, fit_end):
+            dev = (diff[k] + min_positive) - fit_mean
+            fit_var += dev * dev
+        fit_std = np.sqrt(fit_var / (fit_n - 1))  # ddof=1, matching pandas
+
+        out = np.empty(n, dtype=phot.dtype)
+        for k in prange(n):
+            out[k] = ((diff[k] + min_positive) - fit_mean) / fit_std
+        return out
+
+
 class PlottingSetup:
     def __init__(self, baseline_duration, trial_length, fps, fit_window_start, fit_window_end):
         self.baseline_duration_in_mins = baseline_duration
@@ -36,22 +73,31 @@ class PlottingSetup:
                  range(session.plot_start_full, session.plot_end_full))
 
     def calculate_dff(self, photwrit_df, iso_df, brain_region, fit_range, plot_range):
-        phot_signal = photwrit_df[brain_region]
-        iso_signal = iso_df[brain_region]
+        # Work on ndarray views so the arithmetic below stays in NumPy; every
+        # pandas op on the full column would otherwise allocate its own Series
+        phot_signal = photwrit_df[brain_region].to_numpy()
+        iso_signal = iso_df[brain_region].to_numpy()
+        fit_start, fit_end = fit_range.start, fit_range.stop
+        plot_start, plot_end = plot_range.start, plot_range.stop
+
+        if NUMBA_AVAILABLE:
+            photwrit_df[f'{brain_region}_phot_zF'] = _dff_kernel(
+                np.ascontiguousarray(phot_signal), np.ascontiguousarray(iso_signal),
+                fit_start, fit_end, plot_start, plot_end)
+            return
 
-        mean_diff = (phot_signal[fit_range].mean() - iso_signal[fit_range].mean())
+        mean_diff = phot_signal[fit_start:fit_end].mean() - iso_signal[fit_start:fit_end].mean()
 
         # Apply the mean difference to the entire phot brain region column to adjust it against the iso region
-        region_phot_minus_iso = phot_signal - iso_signal + mean_diff
+        region_phot_minus_iso = (phot_signal - iso_signal) + mean_diff
 
         # Adjust delta F/F to only include positive values
-        min_positive_dFF = abs(region_phot_minus_iso[plot_range].min())
+        min_positive_dFF = abs(region_phot_minus_iso[plot_start:plot_end].min())
         region_phot_dF_onlypositive = region_phot_minus_iso + min_positive_dFF
 
-        # Calculate the z-scored signal for the phot brain region
-        mean_dF_onlypositive = region_phot_dF_onlypositive[fit_range].mean()
-        std_dF_onlypositive = region_phot_dF_onlypositive[fit_range].std()
-        region_phot_zF = (region_phot_dF_onlypositive - mean_dF_onlypositive) / std_dF_onlypositive
+        # Calculate the z-scored signal for the phot brain region (ddof=1 matches pandas' std)
+        fit_slab = region_phot_dF_onlypositive[fit_start:fit_end]
+        region_phot_zF = (region_phot_dF_onlypositive - fit_slab.mean()) / fit_slab.std(ddof=1)
         photwrit_df[f'{brain_region}_phot_zF'] = region_phot_zF
         
     def apply_plotting_setup_to_sessions(self, sessions):
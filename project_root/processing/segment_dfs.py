@@ -15,18 +15,20 @@ def create_segment_dfs(segment_names, all_z_score_dfs, all_mouse_segments):
     # Initialize a dictionary to store segment DataFrames
     segment_dfs = {name: {} for name in segment_names}
 
+    # Extract start/end times once per mouse instead of per (mouse, brain_region)
+    segment_arrays = {mouse_id: (np.fromiter((start for start, _ in intervals), dtype=float),
+                                 np.fromiter((end for _, end in intervals), dtype=float))
+                      for mouse_id, intervals in all_mouse_segments.items()}
+
     for (mouse_id, brain_region), df in all_z_score_dfs.items():
-        intervals = all_mouse_segments.get(mouse_id)
-        if intervals is None:
+        if mouse_id not in segment_arrays:
             continue
+        start_times, end_times = segment_arrays[mouse_id]
 
-        # Extract start and end times
-        start_times = [interval[0] for interval in intervals]
-        end_times = [interval[1] for interval in intervals]
-
-        # Use searchsorted to find the indices
-        start_indices = np.searchsorted(df['timestamps'], start_times)
-        end_indices = np.searchsorted(df['timestamps'], end_times)
+        # searchsorted on the raw ndarray skips the pandas comparison path
+        timestamps = df['timestamps'].to_numpy()
+        start_indices = np.searchsorted(timestamps, start_times)
+        end_indices = np.searchsorted(timestamps, end_times, side='right')
 
         # Split the dataframe and assign to corresponding segment
         for name, start, end in zip(segment_names, start_indices, end_indices):
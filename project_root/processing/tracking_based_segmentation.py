@@ -3,34 +3,39 @@
 from data.guppy_loading import list_folders
 
 import os
+import numpy as np
 import pandas as pd
+import pyarrow.csv as pacsv
 
-def find_non_nan_intervals(centroid_coords):
-    nan_to_vals = []
-    val_to_nans = []
-
-    # Use pandas' vectorized operations for efficiency
-    is_nan = centroid_coords.isna()
-    transitions = is_nan != is_nan.shift()
-    transition_indices = transitions[transitions].index
+# Only these columns are ever used below; parsing the rest is wasted work
+TRACKING_COLUMNS = ['CentroidCoords.Arena1.X', 'CentroidCoords.Arena2.X',
+                    'Timestamp.FP3002_System']
 
-    for idx in transition_indices:
-        if not is_nan[idx]:
-            nan_to_vals.append(idx)
-        else:
-            val_to_nans.append(idx)
+def find_non_nan_intervals(centroid_coords):
+    # np.diff on the byte mask yields every interior transition in one C call;
+    # +1 points at the first index of each new run
+    is_nan = centroid_coords.isna().to_numpy(dtype=np.int8)
+    diffs = np.diff(is_nan)
+    nan_to_vals = np.flatnonzero(diffs == -1) + 1
+    val_to_nans = np.flatnonzero(diffs == 1) + 1
 
-    # Handle the start of the series
-    if not is_nan.iloc[0]:
-        nan_to_vals.insert(0, 0)
+    # Handle the start of the series; index 0 always counted as a transition in
+    # the shift()-based version, and a non-NaN start also got the inserted 0
+    if is_nan[0]:
+        val_to_nans = np.concatenate(([0], val_to_nans))
+    else:
+        nan_to_vals = np.concatenate(([0, 0], nan_to_vals))
 
     # Handle the end of the series
-    if not is_nan.iloc[-1]:
-        val_to_nans.append(len(centroid_coords))
+    if not is_nan[-1]:
+        val_to_nans = np.concatenate((val_to_nans, [len(centroid_coords)]))
 
-    # Pair nan_to_vals with val_to_nans to create intervals
-    val_intervals = list(zip(val_to_nans, nan_to_vals))
-    val_intervals = [(a, b) for a, b in val_intervals if (b - a) > 4 * 60]
+    # Pair nan_to_vals with val_to_nans to create intervals, filtered by length
+    n_pairs = min(len(val_to_nans), len(nan_to_vals))
+    starts = val_to_nans[:n_pairs]
+    ends = nan_to_vals[:n_pairs]
+    keep = (ends - starts) > 4 * 60
+    val_intervals = list(zip(starts[keep].tolist(), ends[keep].tolist()))
     if len(val_intervals) != 3:
         print(f'warning: length of val_intervals is {len(val_intervals)} and not 3, None returned')
         return None
@@ -44,26 +49,30 @@ def process_mouse_data_from_path(raw_path):
         #return non_nan_triplet is not None
         for dir_name in list_folders(raw_path):
             directory_path = os.path.join(raw_path, dir_name)
-            first_csv_file = next(f for f in os.listdir(directory_path) 
-                                if f.endswith('.csv') and f.startswith('CenterTopCam_TrackData'))
+            with os.scandir(directory_path) as entries:
+                first_csv_file = next(e.name for e in entries
+                                      if e.name.endswith('.csv') and e.name.startswith('CenterTopCam_TrackData'))
             
-            cam_df = pd.read_csv(os.path.join(directory_path, first_csv_file))
+            table = pacsv.read_csv(os.path.join(directory_path, first_csv_file),
+                                   convert_options=pacsv.ConvertOptions(include_columns=TRACKING_COLUMNS))
+            cam_df = table.to_pandas(self_destruct=True)
             trial, mice_ids = dir_name.split('_')
             mice_ids = mice_ids.split('.')
 
             arena_columns = ['CentroidCoords.Arena1.X', 'CentroidCoords.Arena2.X']
             
+            timestamps = cam_df['Timestamp.FP3002_System'].to_numpy()
             for mouse_id, arena_column in zip(mice_ids, arena_columns):
                 if mouse_id != 'e':
                     nan_mask = cam_df[arena_column].isna()
                     non_nan_triplet = find_non_nan_intervals(cam_df[arena_column])
-                    
+
                     if non_nan_triplet:
-                        all_mouse_intervals_timestamps[mouse_id] = [
-                            (cam_df['Timestamp.FP3002_System'].iloc[a], 
-                             cam_df['Timestamp.FP3002_System'].iloc[b])
-                            for a, b in non_nan_triplet
-                        ]
+                        # two fancy-indexed gathers instead of 2N .iloc dispatches
+                        starts = np.array([a for a, _ in non_nan_triplet])
+                        ends = np.array([b for _, b in non_nan_triplet])
+                        all_mouse_intervals_timestamps[mouse_id] = list(
+                            zip(timestamps[starts].tolist(), timestamps[ends].tolist()))
                         all_mouse_intervals[mouse_id] = non_nan_triplet
         return all_mouse_intervals_timestamps
 
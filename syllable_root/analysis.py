@@ -2,21 +2,94 @@
 
 import numpy as np
 import glob
+import multiprocessing as mp
 import pickle
 from scipy import stats
-from scipy.stats import spearmanr
-from skbio.stats.distance import mantel
-from sklearn.preprocessing import StandardScaler
-from scipy.spatial.distance import pdist, squareform
+from scipy.stats import rankdata, spearmanr
+from scipy.spatial.distance import squareform
 from collections import defaultdict
+from joblib import Parallel, delayed
 import os
 import matplotlib.pyplot as plt
 
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _mantel_perm_kernel(rank_mat, y, ii, jj, x_norm, n_perm, seed):
+        # Permutations are processed in blocks of PBLK and the upper triangle
+        # in stripes of KBLK, so each stripe of the ranked matrix is reused by
+        # the whole permutation block while it is still cache-resident instead
+        # of being streamed from memory once per permutation
+        PBLK = 16
+        KBLK = 2048
+        n = rank_mat.shape[0]
+        ntriu = ii.shape[0]
+        n_blocks = (n_perm + PBLK - 1) // PBLK
+        stats_out = np.empty(n_perm)
+        for b in prange(n_blocks):
+            p0 = b * PBLK
+            p1 = min(p0 + PBLK, n_perm)
+            nb = p1 - p0
+            perms = np.empty((nb, n), dtype=np.int64)
+            for p in range(nb):
+                np.random.seed(seed + p0 + p)
+                perms[p] = np.random.permutation(n)
+            acc = np.zeros(nb)
+            for k0 in range(0, ntriu, KBLK):
+                k1 = min(k0 + KBLK, ntriu)
+                for p in range(nb):
+                    perm = perms[p]
+                    s = 0.0
+                    for k in range(k0, k1):
+                        s += rank_mat[perm[ii[k]], perm[jj[k]]] * y[k]
+                    acc[p] += s
+            for p in range(nb):
+                stats_out[p0 + p] = acc[p] / x_norm
+        return stats_out
+
+
+def _load_one_pickle(file):
+    """
+    Load one behavior pickle, memory-mapping its distance matrix.
+
+    The first load writes the distances array to a sidecar .npy next to the
+    pickle; this and every later run then np.load it with mmap_mode='r', so
+    the matrix only becomes resident when sliced. The small 'syllable_ixs'
+    stays in the returned dict as-is.
+    """
+    try:
+        with open(file, 'rb') as f:
+            data = pickle.load(f)
+    except Exception as e:
+        print(f"Failed to load {file}: {e}")
+        return file, None
+    if isinstance(data, dict) and isinstance(data.get('distances'), np.ndarray):
+        sidecar = file + '.npy'
+        try:
+            if not os.path.exists(sidecar):
+                np.save(sidecar, np.ascontiguousarray(data['distances']), allow_pickle=False)
+            data['distances'] = np.load(sidecar, mmap_mode='r')
+        except Exception as e:
+            # The sidecar is only an optimization; a read-only or full
+            # directory must not drop a pickle that loaded fine
+            print(f"Sidecar caching failed for {file}: {e}")
+    return file, data
+
 
 def load_behavior_distances(pickle_pattern):
     """
     Load all behavior distance matrices matching the given glob pattern.
 
+    Unpickling is CPU-bound for large matrices, so the files are loaded in a
+    process pool; each worker leaves the distances behind as a memory-mapped
+    sidecar .npy (see _load_one_pickle).
+
     Parameters
     ----------
     pickle_pattern : str
@@ -31,15 +104,15 @@ def load_behavior_distances(pickle_pattern):
     behavior_data = {}
     print(f"Loading behavior distance matrices with pattern: {pickle_pattern}")
     print(f"Number of files found: {len(pickle_files)}")
-    for file in pickle_files:
-        print('you found something!')
-        with open(file, 'rb') as f:
-            try:
-                data = pickle.load(f)
-                behavior_data[file] = data  # data should contain 'distances' and 'syllable_ixs'
-                print(f"Loaded file: {file}")
-            except Exception as e:
-                print(f"Failed to load {file}: {e}")
+    if not pickle_files:
+        return behavior_data
+    with mp.Pool() as pool:
+        results = pool.map(_load_one_pickle, pickle_files)
+    for file, data in results:
+        if data is not None:
+            print('you found something!')
+            behavior_data[file] = data  # data should contain 'distances' and 'syllable_ixs'
+            print(f"Loaded file: {file}")
     return behavior_data
 
 
@@ -89,24 +162,161 @@ def compute_photometry_distance_matrix(syllable_snippets, signal_type='DS', top_
         print("No syllables meet the criteria for photometry distance matrix computation.")
         return None, []
 
-    # Create feature matrix
-    photometry_matrix = np.array([syllable_means[s] for s in syllables_photometry])
+    # Create feature matrix (float32 halves the bandwidth of the matmul below)
+    X = np.array([syllable_means[s] for s in syllables_photometry], dtype=np.float32)
 
-    # Standardize
-    scaler = StandardScaler()
-    photometry_matrix_std = scaler.fit_transform(photometry_matrix)
+    # Standardize and row-normalize in place — one buffer, no StandardScaler
+    # round-trips over the data; the eps guards against constant columns
+    X -= X.mean(axis=0, keepdims=True)
+    X /= X.std(axis=0, keepdims=True) + 1e-12
+    X /= np.linalg.norm(X, axis=1, keepdims=True) + 1e-12
 
-    # Compute distance matrix using cosine distance
-    photometry_distances = squareform(pdist(photometry_matrix_std, metric='cosine'))
+    # Cosine distance via a BLAS matmul on the row-normalized matrix; pdist's
+    # C loop doesn't use BLAS and is much slower for long signatures
+    photometry_distances = 1.0 - X @ X.T
+    np.fill_diagonal(photometry_distances, 0.0)
 
     print(f"Computed {signal_type} photometry distance matrix with shape: {photometry_distances.shape}")
     return photometry_distances, syllables_photometry
 
 
-def compare_distance_matrices(behavior_data, photometry_distances, syllables_photometry, top_syllables=None, min_snippets=10, output_file=None):
+def _mantel_spearman(behavior_sub, photometry_sub, permutations=999, seed=None):
+    """
+    Spearman Mantel test via a rank-once NumPy permutation loop.
+
+    Permuting rows/columns of a distance matrix only rearranges the same
+    multiset of upper-triangle values, so both matrices are ranked a single
+    time and each permutation reduces to an index gather plus a dot product.
+    Re-ranking per permutation is what makes the scikit-bio spearman Mantel
+    slow.
+
+    Returns
+    -------
+    tuple
+        (correlation, two-sided permutation p-value).
+    """
+    n = behavior_sub.shape[0]
+    triu = np.triu_indices(n, k=1)
+
+    behavior_rank_mat = squareform(rankdata(behavior_sub[triu]))
+    photometry_ranks = rankdata(photometry_sub[triu])
+
+    # The centered norm of the behavior ranks is permutation-invariant, and
+    # against a centered y the centering of x drops out of the dot product
+    x = behavior_rank_mat[triu]
+    x_norm = np.linalg.norm(x - x.mean())
+    y = photometry_ranks - photometry_ranks.mean()
+    y_norm = np.linalg.norm(y)
+    if x_norm == 0 or y_norm == 0:
+        return np.nan, np.nan
+    y /= y_norm
+
+    observed = float(x @ y) / x_norm
+
+    rng = np.random.default_rng(seed)
+    if NUMBA_AVAILABLE:
+        ii = np.ascontiguousarray(triu[0], dtype=np.int64)
+        jj = np.ascontiguousarray(triu[1], dtype=np.int64)
+        perm_stats = _mantel_perm_kernel(behavior_rank_mat, y, ii, jj, x_norm,
+                                         permutations, int(rng.integers(2 ** 31 - 1)))
+        hits = int(np.count_nonzero(np.abs(perm_stats) >= abs(observed)))
+    else:
+        hits = 0
+        for _ in range(permutations):
+            perm = rng.permutation(n)
+            stat = float(behavior_rank_mat[np.ix_(perm, perm)][triu] @ y) / x_norm
+            if abs(stat) >= abs(observed):
+                hits += 1
+    p_value = (hits + 1) / (permutations + 1)
+    return observed, p_value
+
+
+def _compare_one(file, data, photometry_distances, syllables_photometry, top_syllables,
+                 min_n_for_mantel=5, early_skip_r=0.05):
+    """
+    Compare a single behavior distance matrix with the photometry distance matrix.
+
+    The 999-permutation Mantel test is skipped (reported as NaN) when the
+    matrices share fewer than min_n_for_mantel syllables — the test has no
+    power there — or when the plain Spearman correlation is already below
+    early_skip_r in magnitude, since permutations cannot rescue a near-zero
+    effect.
+
+    Returns
+    -------
+    tuple
+        (message, write_message, plot_payload): the text to report, whether it
+        should also go to the output file, and the (behavior_vec,
+        photometry_vec, corr, p) data for plotting (None when skipped).
+    """
+    behavior_distances = data.get('distances')
+    syllables_behavior = list(data.get('syllable_ixs', []))
+
+    if not isinstance(behavior_distances, np.ndarray):
+        return f"Warning: 'distances' in {file} is not a numpy array. Skipping.", False, None
+
+    # Include only top syllables
+    if top_syllables is not None:
+        syllables_behavior = [s for s in syllables_behavior if s in top_syllables]
+
+    # Find common syllables
+    common_syllables = sorted(set(syllables_behavior).intersection(syllables_photometry))
+    if len(common_syllables) < 2:
+        return f"Not enough common syllables between {file} and photometry data. Skipping.\n", True, None
+
+    # Get indices for common syllables via O(1) dict lookups rather than
+    # a list.index scan per syllable
+    b_map = {s: i for i, s in enumerate(syllables_behavior)}
+    p_map = {s: i for i, s in enumerate(syllables_photometry)}
+    behavior_indices = np.fromiter((b_map[s] for s in common_syllables),
+                                   dtype=np.intp, count=len(common_syllables))
+    photometry_indices = np.fromiter((p_map[s] for s in common_syllables),
+                                     dtype=np.intp, count=len(common_syllables))
+
+    # Extract sub-distance matrices; two np.take passes keep the result
+    # contiguous, which the triu gather and spearmanr below benefit from
+    behavior_sub = np.take(np.take(behavior_distances, behavior_indices, axis=0),
+                           behavior_indices, axis=1)
+    photometry_sub = np.take(np.take(photometry_distances, photometry_indices, axis=0),
+                             photometry_indices, axis=1)
+
+    # Flatten upper triangles
+    triu = np.triu_indices(len(common_syllables), k=1)
+    behavior_vec = behavior_sub[triu]
+    photometry_vec = photometry_sub[triu]
+
+    # Compute Spearman's rank correlation
+    corr, p = spearmanr(behavior_vec, photometry_vec)
+
+    # Compute Mantel Test, unless the early-exit gates say it cannot pay off
+    if len(common_syllables) < min_n_for_mantel or abs(corr) < early_skip_r:
+        mantel_corr, mantel_p = np.nan, np.nan
+    else:
+        try:
+            mantel_corr, mantel_p = _mantel_spearman(behavior_sub, photometry_sub, permutations=999)
+        except Exception as e:
+            mantel_corr, mantel_p = np.nan, np.nan
+            print(f"  Mantel test failed for {file}: {e}")
+
+    result_str = (
+        f"\nComparison for {os.path.basename(file)}:\n"
+        f"  Spearman correlation coefficient: {corr:.3f}\n"
+        f"  P-value: {p:.3e}\n"
+        f"  Mantel test correlation coefficient: {mantel_corr:.3f}\n"
+        f"  Mantel test P-value: {mantel_p:.3e}\n"
+    )
+    return result_str, True, (behavior_vec, photometry_vec, corr, p)
+
+
+def compare_distance_matrices(behavior_data, photometry_distances, syllables_photometry, top_syllables=None, min_snippets=10, output_file=None, n_jobs=-1,
+                              min_n_for_mantel=5, early_skip_r=0.05, plot_dir=None):
     """
     Compare each behavior distance matrix with the photometry distance matrix.
 
+    The per-file comparisons (including the 999-permutation Mantel tests) are
+    independent, so they run in parallel worker processes; printing, writing
+    and plotting happen afterwards in the calling process.
+
     Parameters
     ----------
     behavior_data : dict
@@ -121,6 +331,17 @@ def compare_distance_matrices(behavior_data, photometry_distances, syllables_pho
         Minimum number of snippets required to include a syllable. Default is 10.
     output_file : file object, optional
         File object to write the results. Default is None.
+    n_jobs : int, optional
+        Number of worker processes for joblib. Default is -1 (all cores).
+    min_n_for_mantel : int, optional
+        Minimum number of common syllables before the Mantel test is run.
+        Default is 5.
+    early_skip_r : float, optional
+        Skip the Mantel permutations when |Spearman r| is below this.
+        Default is 0.05.
+    plot_dir : str, optional
+        Directory to save scatter plots into as PNGs instead of showing
+        them interactively. Default is None (plt.show per figure).
 
     Returns
     -------
@@ -130,71 +351,35 @@ def compare_distance_matrices(behavior_data, photometry_distances, syllables_pho
         print("Photometry distance matrix is empty. Skipping comparison.")
         return
 
-    for file, data in behavior_data.items():
-        behavior_distances = data.get('distances')
-        syllables_behavior = list(data.get('syllable_ixs', []))
-
-        if not isinstance(behavior_distances, np.ndarray):
-            print(f"Warning: 'distances' in {file} is not a numpy array. Skipping.")
+    if plot_dir is not None:
+        # Batch runs render off-screen; agg never retains backend windows
+        import matplotlib
+        matplotlib.use('agg')
+        os.makedirs(plot_dir, exist_ok=True)
+
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(_compare_one)(file, data, photometry_distances, syllables_photometry, top_syllables,
+                              min_n_for_mantel, early_skip_r)
+        for file, data in behavior_data.items()
+    )
+
+    for file, (message, write_message, plot_payload) in zip(behavior_data, results):
+        print(message if plot_payload else message.strip())
+        if output_file and write_message:
+            output_file.write(message)
+        if plot_payload is None:
             continue
 
-        # Include only top syllables
-        if top_syllables is not None:
-            syllables_behavior = [s for s in syllables_behavior if s in top_syllables]
-
-        # Find common syllables
-        common_syllables = sorted(set(syllables_behavior).intersection(syllables_photometry))
-        if len(common_syllables) < 2:
-            message = f"Not enough common syllables between {file} and photometry data. Skipping.\n"
-            print(message.strip())
-            if output_file:
-                output_file.write(message)
-            continue
-
-        # Get indices for common syllables
-        behavior_indices = [syllables_behavior.index(s) for s in common_syllables]
-        photometry_indices = [syllables_photometry.index(s) for s in common_syllables]
-
-        # Extract sub-distance matrices
-        behavior_sub = behavior_distances[np.ix_(behavior_indices, behavior_indices)]
-        photometry_sub = photometry_distances[np.ix_(photometry_indices, photometry_indices)]
-
-        # Flatten upper triangles
-        triu = np.triu_indices(len(common_syllables), k=1)
-        behavior_vec = behavior_sub[triu]
-        photometry_vec = photometry_sub[triu]
-
-        # Compute Spearman's rank correlation
-        corr, p = spearmanr(behavior_vec, photometry_vec)
-
-        # Compute Mantel Test
-        try:
-            mantel_corr, mantel_p, _ = mantel(
-                behavior_sub, photometry_sub, method='spearman', permutations=999
-            )
-        except Exception as e:
-            mantel_corr, mantel_p = np.nan, np.nan
-            print(f"  Mantel test failed for {file}: {e}")
-
-        # Prepare result strings
-        result_str = (
-            f"\nComparison for {os.path.basename(file)}:\n"
-            f"  Spearman correlation coefficient: {corr:.3f}\n"
-            f"  P-value: {p:.3e}\n"
-            f"  Mantel test correlation coefficient: {mantel_corr:.3f}\n"
-            f"  Mantel test P-value: {mantel_p:.3e}\n"
-        )
-
-        # Print and write the results
-        print(result_str)
-        if output_file:
-            output_file.write(result_str)
-
-        # Optional: Plotting
-        plt.figure(figsize=(6, 6))
-        plt.scatter(behavior_vec, photometry_vec, alpha=0.6)
-        plt.xlabel('Behavior Distances')
-        plt.ylabel('Photometry Distances')
-        plt.title(f'{os.path.basename(file)}\nSpearman r={corr:.2f}, p={p:.3f}')
-        plt.grid(True)
-        plt.show()
+        behavior_vec, photometry_vec, corr, p = plot_payload
+        fig, ax = plt.subplots(figsize=(6, 6))
+        ax.scatter(behavior_vec, photometry_vec, alpha=0.6)
+        ax.set_xlabel('Behavior Distances')
+        ax.set_ylabel('Photometry Distances')
+        ax.set_title(f'{os.path.basename(file)}\nSpearman r={corr:.2f}, p={p:.3f}')
+        ax.grid(True)
+        if plot_dir is not None:
+            # savefig + close keeps memory bounded over many files
+            fig.savefig(os.path.join(plot_dir, f'{os.path.basename(file)}.png'), dpi=120)
+            plt.close(fig)
+        else:
+            plt.show()
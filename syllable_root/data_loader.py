@@ -41,35 +41,73 @@ def load_syllable_data(file_path, include_latent_state=True):
                 raise ValueError(f"Error: Multiple groups found for Mouse ID '{mouse_id}' in the file. Only one group per Mouse ID is expected.")
 
             group = file[group_name]
-            df_list = []
 
+            # First pass over the group collects the column layout without reading data
+            layout = []
+            total_cols = 0
+            n_rows = 0
             for dataset_name in group.keys():
                 # Exclude 'latent_state' datasets if the flag is False
                 if not include_latent_state and dataset_name.startswith('latent_state'):
                     continue
 
-                dataset = group[dataset_name][:]
-                
-                # Convert 1D datasets to 2D
-                if dataset.ndim == 1:
-                    dataset = dataset.reshape(-1, 1)
-                
-                num_cols = dataset.shape[1]
-                columns = [f"{dataset_name}_{i}" for i in range(num_cols)]
-                
-                df = pd.DataFrame(dataset, columns=columns)
-                df_list.append(df)
-
-            if df_list:
-                # Concatenate all DataFrames horizontally
-                concatenated_df = pd.concat(df_list, axis=1)
-                syllable_dfs[mouse_id] = concatenated_df
+                dataset = group[dataset_name]
+                num_cols = dataset.shape[1] if dataset.ndim > 1 else 1
+                layout.append((dataset_name, dataset, total_cols, num_cols))
+                total_cols += num_cols
+                n_rows = max(n_rows, dataset.shape[0])
+
+            if layout:
+                # One float32 allocation for the whole group; read_direct streams each
+                # dataset straight into its column slice with no temporary arrays, and
+                # the NaN fill pads datasets shorter than n_rows (as pd.concat did)
+                buf = np.full((n_rows, total_cols), np.nan, dtype=np.float32)
+                columns = []
+                for dataset_name, dataset, col_start, num_cols in layout:
+                    rows = dataset.shape[0]
+                    if dataset.ndim == 1:
+                        dataset.read_direct(buf, dest_sel=np.s_[:rows, col_start])
+                    else:
+                        dataset.read_direct(buf, dest_sel=np.s_[:rows, col_start:col_start + num_cols])
+                    columns.extend(f"{dataset_name}_{i}" for i in range(num_cols))
+
+                syllable_dfs[mouse_id] = pd.DataFrame(buf, columns=columns, copy=False)
             else:
                 print(f"Warning: No datasets found in group '{group_name}'.")
 
     return syllable_dfs
 
 
+def _load_csv_data(mouse_ids, prefix_func, select_columns, kind):
+    """
+    Shared CSV loader for tracking and fiber data.
+
+    Sniffs the header with nrows=0, lets select_columns pick the columns to
+    keep, and pushes that selection into the multi-threaded pyarrow parser so
+    dropped columns are never parsed or materialized.
+    """
+    dfs = {}
+
+    for mouse_id in mouse_ids:
+        file_path = prefix_func(mouse_id)
+        try:
+            header = pd.read_csv(file_path, nrows=0).columns
+            cols_to_keep = select_columns(header)
+            df = pd.read_csv(file_path, usecols=list(set(cols_to_keep)), engine='pyarrow')
+            dfs[str(mouse_id)] = df[cols_to_keep].reset_index(drop=True)
+        except FileNotFoundError:
+            print(f"Warning: {kind} file for Mouse ID {mouse_id} not found at '{file_path}'. Skipping.")
+        except Exception as e:
+            print(f"Error loading {kind.lower()} data for Mouse ID {mouse_id}: {e}")
+
+    return dfs
+
+
+def _fiber_columns(header):
+    # Keep columns that don't start with 'fiber' or 'Fiber' and the last two columns
+    return [col for col in header if not col.lower().startswith('fiber')] + list(header[-2:])
+
+
 def load_tracking_data(mouse_ids, tracking_prefix_func):
     """
     Load tracking data from CSV files for each mouse ID.
@@ -86,21 +124,9 @@ def load_tracking_data(mouse_ids, tracking_prefix_func):
     dict
         A dictionary where keys are Mouse IDs (as strings) and values are pandas DataFrames containing the tracking data.
     """
-    tracking_dfs = {}
-
-    for mouse_id in mouse_ids:
-        file_path = tracking_prefix_func(mouse_id)
-        try:
-            df = pd.read_csv(file_path)
-            # Select the first column and the last three columns
-            cols_to_keep = df.columns[[0] + list(range(-3, 0))]
-            tracking_dfs[str(mouse_id)] = df[cols_to_keep].reset_index(drop=True)
-        except FileNotFoundError:
-            print(f"Warning: Tracking file for Mouse ID {mouse_id} not found at '{file_path}'. Skipping.")
-        except Exception as e:
-            print(f"Error loading tracking data for Mouse ID {mouse_id}: {e}")
-
-    return tracking_dfs
+    # Select the first column and the last three columns
+    return _load_csv_data(mouse_ids, tracking_prefix_func,
+                          lambda header: header[[0] + list(range(-3, 0))], 'Tracking')
 
 
 def load_fiber_data(mouse_ids, fiber_prefix_func):
@@ -119,21 +145,7 @@ def load_fiber_data(mouse_ids, fiber_prefix_func):
     dict
         A dictionary where keys are Mouse IDs (as strings) and values are pandas DataFrames containing the fiber data.
     """
-    fiber_dfs = {}
-
-    for mouse_id in mouse_ids:
-        file_path = fiber_prefix_func(mouse_id)
-        try:
-            df = pd.read_csv(file_path)
-            # Keep columns that don't start with 'fiber' or 'Fiber' and the last two columns
-            columns_to_keep = [col for col in df.columns if not col.lower().startswith('fiber')] + list(df.columns[-2:])
-            fiber_dfs[str(mouse_id)] = df[columns_to_keep].reset_index(drop=True)
-        except FileNotFoundError:
-            print(f"Warning: Fiber file for Mouse ID {mouse_id} not found at '{file_path}'. Skipping.")
-        except Exception as e:
-            print(f"Error loading fiber data for Mouse ID {mouse_id}: {e}")
-
-    return fiber_dfs
+    return _load_csv_data(mouse_ids, fiber_prefix_func, _fiber_columns, 'Fiber')
 
 
 def load_fiber_data_guppy(mouse_ids, fiber_prefix_func):
@@ -152,21 +164,7 @@ def load_fiber_data_guppy(mouse_ids, fiber_prefix_func):
     dict
         A dictionary where keys are Mouse IDs (as strings) and values are pandas DataFrames containing the fiber data.
     """
-    fiber_dfs = {}
-
-    for mouse_id in mouse_ids:
-        file_path = fiber_prefix_func(mouse_id)
-        try:
-            df = pd.read_csv(file_path)
-            # Keep columns that don't start with 'fiber' or 'Fiber' and the last two columns
-            columns_to_keep = [col for col in df.columns if not col.lower().startswith('fiber')] + list(df.columns[-2:])
-            fiber_dfs[str(mouse_id)] = df[columns_to_keep].reset_index(drop=True)
-        except FileNotFoundError:
-            print(f"Warning: Fiber file for Mouse ID {mouse_id} not found at '{file_path}'. Skipping.")
-        except Exception as e:
-            print(f"Error loading fiber data for Mouse ID {mouse_id}: {e}")
-
-    return fiber_dfs
+    return _load_csv_data(mouse_ids, fiber_prefix_func, _fiber_columns, 'Fiber')
 
 
 def align_and_merge_data(syllable_dfs, tracking_dfs, fiber_dfs):
@@ -248,6 +246,18 @@ def align_and_merge_data(syllable_dfs, tracking_dfs, fiber_dfs):
                     rename_columns[col] = 'DS_470'
             merged_df = merged_df.rename(columns=rename_columns)
 
+            # Downcast the hot columns: photometry signals tolerate single
+            # precision, and syllable ids (0..39) fit in a small integer
+            for col in ('DS_470', 'VS_470', 'SecFromInjection_fiber'):
+                if col in merged_df.columns:
+                    merged_df[col] = merged_df[col].astype(np.float32)
+            if 'syllable_0' in merged_df.columns:
+                syllable_col = pd.to_numeric(merged_df['syllable_0'], errors='coerce')
+                if not syllable_col.isna().any():
+                    downcast = 'unsigned' if (syllable_col >= 0).all() else 'integer'
+                    syllable_col = pd.to_numeric(syllable_col, downcast=downcast)
+                merged_df['syllable_0'] = syllable_col
+
             merged_dfs[mouse_id] = merged_df
         except Exception as e:
             print(f"Error merging data for Mouse ID {mouse_id}: {e}")
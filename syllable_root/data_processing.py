@@ -1,10 +1,146 @@
 # data_processing.py
 
+import hashlib
+import os
+
 import numpy as np
 import pandas as pd
 from collections import defaultdict
+from dataclasses import dataclass
+from joblib import Parallel, delayed
 from scipy import stats
 
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _mean_ci_kernel(data):
+        # One Welford pass per time point: mean and M2 accumulate in a single
+        # walk over the snippet axis instead of separate mean/std/sem passes
+        n, t = data.shape
+        mean_out = np.empty(t)
+        sem_out = np.empty(t)
+        for j in prange(t):
+            mean = 0.0
+            m2 = 0.0
+            count = 0.0
+            for i in range(n):
+                count += 1.0
+                delta = data[i, j] - mean
+                mean += delta / count
+                m2 += delta * (data[i, j] - mean)
+            mean_out[j] = mean
+            # ddof=1, matching stats.sem
+            sem_out[j] = np.sqrt(m2 / (count - 1.0) / count) if count > 1.0 else np.nan
+        return mean_out, sem_out
+
+
+_EXTRACTOR_CACHE = {}
+
+
+def _make_extractor(m, n, window_size, norm_frame):
+    """
+    Compile a snippet-extraction kernel specialized for one parameter set.
+
+    m, n, window_size and norm_frame are closed over, so Numba treats them as
+    compile-time constants and can unroll the fixed-length window loops. The
+    compiled kernel is memoized per parameter tuple; fastmath deliberately
+    keeps the no-NaN assumption off so the isnan checks survive optimization.
+    """
+    key = (m, n, window_size, norm_frame)
+    extract = _EXTRACTOR_CACHE.get(key)
+    if extract is not None:
+        return extract
+
+    # No cache=True here: numba cannot disk-cache closures over outer
+    # variables and would warn on every compile; _EXTRACTOR_CACHE already
+    # reuses the compiled kernel within the process
+    @njit(fastmath={'contract', 'reassoc', 'arcp'}, boundscheck=False)
+    def extract(ds, vs, idx, out_ds, out_vs):
+        for k in range(idx.shape[0]):
+            c = idx[k]
+            for j in range(-m, n + 1):
+                pos = c + j
+                lo = pos - window_size + 1
+                if lo < 0:
+                    lo = 0
+                # trailing rolling mean over valid samples, min_periods=1 style
+                s = 0.0
+                cnt = 0
+                for t in range(lo, pos + 1):
+                    v = ds[t]
+                    if not np.isnan(v):
+                        s += v
+                        cnt += 1
+                out_ds[k, j + m] = s / cnt if cnt > 0 else np.nan
+                s = 0.0
+                cnt = 0
+                for t in range(lo, pos + 1):
+                    v = vs[t]
+                    if not np.isnan(v):
+                        s += v
+                        cnt += 1
+                out_vs[k, j + m] = s / cnt if cnt > 0 else np.nan
+            # subtract the normalization frame in place
+            base_ds = out_ds[k, norm_frame]
+            base_vs = out_vs[k, norm_frame]
+            for j in range(m + n + 1):
+                out_ds[k, j] -= base_ds
+                out_vs[k, j] -= base_vs
+
+    _EXTRACTOR_CACHE[key] = extract
+    return extract
+
+
+@dataclass
+class MouseData:
+    """
+    Struct-of-arrays view of the per-mouse columns the analysis actually touches.
+
+    Keeping these as flat typed arrays avoids pandas block-manager overhead in
+    the counting and snippet-extraction hot paths; the wide merged DataFrame is
+    only needed to build this once.
+    """
+    syllable: np.ndarray
+    ds: np.ndarray
+    vs: np.ndarray
+    sec: np.ndarray
+    genotype: str
+
+    @classmethod
+    def from_dataframe(cls, df):
+        df = df.reset_index(drop=True)
+        genotype = (str(df['Genotype_syllable'].iloc[0])
+                    if 'Genotype_syllable' in df.columns and len(df) else 'Unknown')
+        # The signal and injection-time columns are absent when
+        # align_and_merge_data found no matching fiber columns; counting-only
+        # callers never touch them, so missing ones become all-NaN fillers
+        ds = (df['DS_470'].to_numpy(dtype=np.float32) if 'DS_470' in df.columns
+              else np.full(len(df), np.nan, dtype=np.float32))
+        vs = (df['VS_470'].to_numpy(dtype=np.float32) if 'VS_470' in df.columns
+              else np.full(len(df), np.nan, dtype=np.float32))
+        sec = (pd.to_numeric(df['SecFromInjection_fiber'], errors='coerce').to_numpy(dtype=np.float64)
+               if 'SecFromInjection_fiber' in df.columns
+               else np.full(len(df), np.nan))
+        return cls(
+            syllable=pd.to_numeric(df['syllable_0'], errors='coerce').to_numpy(dtype=np.float64),
+            ds=ds,
+            vs=vs,
+            sec=sec,
+            genotype=genotype,
+        )
+
+
+def to_mouse_data(merged_dfs):
+    """Convert a dict of merged DataFrames into per-mouse MouseData structs."""
+    return {mouse_id: df if isinstance(df, MouseData) else MouseData.from_dataframe(df)
+            for mouse_id, df in merged_dfs.items()}
+
 
 def compute_syllable_counts(merged_dfs):
     """
@@ -18,62 +154,69 @@ def compute_syllable_counts(merged_dfs):
     Returns
     -------
     tuple
-        initiations_proportions (dict): Proportion of initiations per syllable.
-        time_spent_proportions (dict): Proportion of time spent per syllable.
+        init_props (np.ndarray): (n_mice, n_syllables) initiation proportions.
+        time_props (np.ndarray): (n_mice, n_syllables) time spent proportions.
+        all_syllables (list): Sorted syllable values labelling the columns.
     """
-    initiations_proportions = defaultdict(list)
-    time_spent_proportions = defaultdict(list)
     all_syllables = set()
 
+    # Accept either merged DataFrames or MouseData structs
+    mouse_data = to_mouse_data(merged_dfs)
+
     # Gather all unique syllables
-    for df in merged_dfs.values():
-        all_syllables.update(df['syllable_0'].dropna().unique())
+    for data in mouse_data.values():
+        syllables = data.syllable
+        all_syllables.update(syllables[~np.isnan(syllables)].tolist())
 
     all_syllables = sorted(all_syllables)
-
-    for mouse_id, df in merged_dfs.items():
-        # Ensure syllable_0 is numeric
-        df['syllable_0'] = pd.to_numeric(df['syllable_0'], errors='coerce')
-
-        # Compute initiations
-        syllable_series = df['syllable_0']
-        syllable_shift = syllable_series.shift(1)
-        initiations = (syllable_series != syllable_shift) & (~syllable_series.isna())
-
-        # Count initiations per syllable
-        num_initiations = syllable_series[initiations].value_counts()
+    syllable_index = np.asarray(all_syllables)
+    n_syllables = len(all_syllables)
+
+    # One row per mouse instead of a dict of Python lists per syllable;
+    # bincount fills each row in a single C inner loop
+    init_props = np.zeros((len(mouse_data), n_syllables), dtype=np.float32)
+    time_props = np.zeros((len(mouse_data), n_syllables), dtype=np.float32)
+
+    for row, data in enumerate(mouse_data.values()):
+        syllables = data.syllable
+        if len(syllables) == 0:
+            continue  # row stays all zeros, like a mouse with no initiations
+
+        # Branchless initiation detection: one elementwise pass, no shift temporaries
+        initiations = np.empty(len(syllables), dtype=np.bool_)
+        initiations[0] = True
+        np.not_equal(syllables[1:], syllables[:-1], out=initiations[1:])
+        initiations &= ~np.isnan(syllables)
+
+        # Map to contiguous ids and count with bincount's C inner loop
+        init_ids = np.searchsorted(syllable_index, syllables[initiations])
+        num_initiations = np.bincount(init_ids, minlength=n_syllables)
         total_initiations = num_initiations.sum()
-
-        # Calculate initiation proportions
-        proportions_initiations = num_initiations / total_initiations if total_initiations > 0 else pd.Series()
+        if total_initiations > 0:
+            init_props[row] = num_initiations / total_initiations
 
         # Count time spent per syllable
-        time_spent = syllable_series.value_counts()
+        time_ids = np.searchsorted(syllable_index, syllables[~np.isnan(syllables)])
+        time_spent = np.bincount(time_ids, minlength=n_syllables)
         total_time = time_spent.sum()
+        if total_time > 0:
+            time_props[row] = time_spent / total_time
 
-        # Calculate time spent proportions
-        proportions_time_spent = time_spent / total_time if total_time > 0 else pd.Series()
-
-        # Collect proportions for each syllable
-        for syllable in all_syllables:
-            prop_init = proportions_initiations.get(syllable, 0)
-            prop_time = proportions_time_spent.get(syllable, 0)
-            initiations_proportions[syllable].append(prop_init)
-            time_spent_proportions[syllable].append(prop_time)
+    return init_props, time_props, all_syllables
 
-    return initiations_proportions, time_spent_proportions
 
-
-def rank_syllables(initiations_proportions, time_spent_proportions):
+def rank_syllables(init_props, time_props, syllables):
     """
     Rank syllables using the Borda count method based on initiation and time spent proportions.
 
     Parameters
     ----------
-    initiations_proportions : dict
-        Proportion of initiations per syllable.
-    time_spent_proportions : dict
-        Proportion of time spent per syllable.
+    init_props : np.ndarray
+        (n_mice, n_syllables) initiation proportions from compute_syllable_counts.
+    time_props : np.ndarray
+        (n_mice, n_syllables) time spent proportions from compute_syllable_counts.
+    syllables : list
+        Sorted syllable values labelling the columns of both matrices.
 
     Returns
     -------
@@ -82,44 +225,172 @@ def rank_syllables(initiations_proportions, time_spent_proportions):
         avg_time_spent_proportions (dict): Average time spent proportions per syllable.
         final_ranking (list): Final ranked list of syllables based on Borda count.
     """
-    avg_initiations_proportions = {}
-    avg_time_spent_proportions = {}
-    borda_scores = defaultdict(int)
-
-    syllables = sorted(initiations_proportions.keys())
     num_syllables = len(syllables)
 
-    # Compute average proportions
-    for syllable in syllables:
-        avg_init = np.mean(initiations_proportions[syllable]) if initiations_proportions[syllable] else 0
-        avg_time = np.mean(time_spent_proportions[syllable]) if time_spent_proportions[syllable] else 0
-        avg_initiations_proportions[syllable] = avg_init
-        avg_time_spent_proportions[syllable] = avg_time
-
-    # Sort syllables based on initiation proportions
-    sorted_initiations = sorted(avg_initiations_proportions.items(), key=lambda x: x[1], reverse=True)
-    # Sort syllables based on time spent proportions
-    sorted_time_spent = sorted(avg_time_spent_proportions.items(), key=lambda x: x[1], reverse=True)
+    # Average across mice in two vectorized column reductions
+    init_arr = init_props.mean(axis=0) if len(init_props) else np.zeros(num_syllables)
+    time_arr = time_props.mean(axis=0) if len(time_props) else np.zeros(num_syllables)
+    avg_initiations_proportions = dict(zip(syllables, init_arr.tolist()))
+    avg_time_spent_proportions = dict(zip(syllables, time_arr.tolist()))
 
-    # Assign Borda points
-    for rank, (syllable, _) in enumerate(sorted_initiations):
-        points = num_syllables - rank
-        borda_scores[syllable] += points
-
-    for rank, (syllable, _) in enumerate(sorted_time_spent):
-        points = num_syllables - rank
-        borda_scores[syllable] += points
+    # Descending ordinal ranks replace the two Python sorts; rank 1 earns
+    # num_syllables Borda points, matching the old rank-0 assignment
+    init_ranks = stats.rankdata(-init_arr, method='ordinal')
+    time_ranks = stats.rankdata(-time_arr, method='ordinal')
+    borda_scores = (num_syllables + 1 - init_ranks) + (num_syllables + 1 - time_ranks)
 
     # Final ranking based on Borda scores
-    final_ranking = sorted(borda_scores.items(), key=lambda x: x[1], reverse=True)
+    order = np.argsort(-borda_scores, kind='stable')
+    final_ranking = [(syllables[i], int(borda_scores[i])) for i in order]
 
     return avg_initiations_proportions, avg_time_spent_proportions, final_ranking
 
 
-def extract_signal_snippets(merged_dfs, parameters):
+def _rolling_mean_min1(arr, window):
+    """
+    Trailing rolling mean matching pd.Series.rolling(window, min_periods=1).mean(),
+    including its NaN handling, computed from two cumulative sums instead of the
+    pandas rolling machinery.
+    """
+    arr = np.asarray(arr, dtype=np.float64)
+    valid = ~np.isnan(arr)
+    sums = np.cumsum(np.where(valid, arr, 0.0))
+    counts = np.cumsum(valid).astype(np.float64)
+
+    win_sums = sums.copy()
+    win_sums[window:] -= sums[:-window]
+    win_counts = counts.copy()
+    win_counts[window:] -= counts[:-window]
+
+    # All-NaN windows stay NaN, like min_periods=1 with no valid samples
+    return np.divide(win_sums, win_counts,
+                     out=np.full(len(arr), np.nan), where=win_counts > 0)
+
+
+def _cached_rolling(name, arr, window_size, cache_dir):
+    """
+    Load or compute the rolled signal column, persisted as an .npy file.
+
+    The filename keys on the mouse/signal name, the window size and a cheap
+    content fingerprint (length plus an md5 of the first samples), so a file
+    written for a different recording is not reused. np.load with
+    mmap_mode='r' returns a read-only view, so repeated parameter sweeps with
+    the same window_size skip both the computation and the full reload.
+    """
+    fingerprint = hashlib.md5(arr[:1024].tobytes() + str(len(arr)).encode()).hexdigest()[:12]
+    path = os.path.join(cache_dir, f"rolled_{name}_w{window_size}_{fingerprint}.npy")
+    if os.path.exists(path):
+        return np.load(path, mmap_mode='r')
+    rolled = _rolling_mean_min1(arr, window_size).astype(np.float32)
+    os.makedirs(cache_dir, exist_ok=True)
+    np.save(path, rolled, allow_pickle=False)
+    return rolled
+
+
+def _extract_one(mouse_id, data, parameters):
+    """
+    Extract all snippet blocks for a single mouse.
+
+    Runs in a joblib worker process; returns (genotype, results) where
+    results maps injection phase -> syllable -> (DS block, VS block), or
+    (None, None) when required columns are missing.
+    """
+    m = parameters.get('m', 150)
+    n = parameters.get('n', 150)
+    normalization_frame = parameters.get('normalization_frame', 0)
+    window_size = parameters.get('window_size', 15)
+    cache_dir = parameters.get('cache_dir')
+
+    if not isinstance(data, MouseData):
+        # Ensure required columns are present
+        required_columns = {'DS_470', 'VS_470', 'syllable_0', 'SecFromInjection_fiber'}
+        if not required_columns.issubset(data.columns):
+            print(f"Warning: Required columns missing in DataFrame for Mouse ID {mouse_id}. Skipping.")
+            return None, None
+        data = MouseData.from_dataframe(data)
+
+    syllables = data.syllable
+    sec_from_injection = data.sec
+    if len(syllables) == 0:
+        return data.genotype, {}
+
+    offsets = np.arange(-m, n + 1)
+    # The fused kernel has no reusable rolled column, so caching forces the
+    # rolled-column path
+    extractor = (_make_extractor(m, n, window_size, normalization_frame)
+                 if NUMBA_AVAILABLE and cache_dir is None else None)
+
+    if extractor is None:
+        if cache_dir is not None:
+            ds_rolled = _cached_rolling(f"{mouse_id}_ds", data.ds, window_size, cache_dir)
+            vs_rolled = _cached_rolling(f"{mouse_id}_vs", data.vs, window_size, cache_dir)
+        else:
+            # Roll the full signal columns once; each snippet is then just a slice.
+            # float32 halves the memory of every snippet block gathered below.
+            ds_rolled = _rolling_mean_min1(data.ds, window_size).astype(np.float32)
+            vs_rolled = _rolling_mean_min1(data.vs, window_size).astype(np.float32)
+
+    # Identify syllable initiations branchlessly, writing into one buffer
+    initiations = np.empty(len(syllables), dtype=np.bool_)
+    initiations[0] = True
+    np.not_equal(syllables[1:], syllables[:-1], out=initiations[1:])
+    initiations &= ~np.isnan(syllables)
+
+    # Define time windows in minutes
+    pre_injection_window_start = -25
+    pre_injection_window_end = -5
+    post_injection_window_start = 10
+    post_injection_window_end = 40
+
+    pre_mask = (sec_from_injection >= pre_injection_window_start) & \
+               (sec_from_injection <= pre_injection_window_end)
+    post_mask = (sec_from_injection >= post_injection_window_start) & \
+                (sec_from_injection <= post_injection_window_end)
+
+    # Only keep top syllables (0 to 39)
+    top_syllables = np.arange(40)
+    candidates = initiations & np.isin(syllables, top_syllables)
+
+    results = {}
+    for injection_phase, phase_mask in (('pre', pre_mask), ('post', post_mask)):
+        initiation_indices = np.flatnonzero(candidates & phase_mask)
+        # Keep only initiations whose window lies within DataFrame bounds
+        initiation_indices = initiation_indices[(initiation_indices >= m) &
+                                                (initiation_indices + n < len(syllables))]
+        if initiation_indices.size == 0:
+            continue
+
+        if extractor is not None:
+            # The specialized kernel rolls, gathers and normalizes in one pass
+            snippets_DS = np.empty((initiation_indices.size, m + n + 1), dtype=np.float32)
+            snippets_VS = np.empty_like(snippets_DS)
+            extractor(data.ds, data.vs, initiation_indices, snippets_DS, snippets_VS)
+        else:
+            # One 2D gather per signal instead of a Python loop per initiation
+            snippets_DS = ds_rolled[initiation_indices[:, None] + offsets]
+            snippets_VS = vs_rolled[initiation_indices[:, None] + offsets]
+
+            # Normalize the signals against the normalization frame, in place
+            snippets_DS -= snippets_DS[:, normalization_frame][:, None]
+            snippets_VS -= snippets_VS[:, normalization_frame][:, None]
+
+        per_phase = results.setdefault(injection_phase, {})
+        snippet_syllables = syllables[initiation_indices].astype(np.int64)
+        for syllable in np.unique(snippet_syllables):
+            rows = snippet_syllables == syllable
+            per_phase[int(syllable)] = (snippets_DS[rows], snippets_VS[rows])
+
+    return data.genotype, results
+
+
+def extract_signal_snippets(merged_dfs, parameters, n_jobs=-1):
     """
     Extract and normalize signal snippets around syllable initiations.
 
+    Each mouse is independent after the MouseData conversion, so the
+    per-mouse extraction runs in parallel worker processes and only the
+    block merging happens here.
+
     Parameters
     ----------
     merged_dfs : dict
@@ -131,6 +402,10 @@ def extract_signal_snippets(merged_dfs, parameters):
             - normalization_frame: int, frame index corresponding to initiation
             - window_size: int, rolling mean window size
             - min_snippets_required: int, minimum number of snippets required per syllable
+            - cache_dir: str, optional directory for persisting rolled columns
+              across runs sharing the same window_size
+    n_jobs : int, optional
+        Number of worker processes for joblib. Default is -1 (all cores).
 
     Returns
     -------
@@ -138,98 +413,82 @@ def extract_signal_snippets(merged_dfs, parameters):
         syllable_snippets_DS (defaultdict): Normalized DS_470 signal snippets.
         syllable_snippets_VS (defaultdict): Normalized VS_470 signal snippets.
     """
-    m = parameters.get('m', 150)
-    n = parameters.get('n', 150)
-    normalization_frame = parameters.get('normalization_frame', 0)
-    window_size = parameters.get('window_size', 15)
-    min_snippets_required = parameters.get('min_snippets_required', 10)
-
-    syllable_snippets_DS = defaultdict(lambda: defaultdict(lambda: defaultdict(list)))
-    syllable_snippets_VS = defaultdict(lambda: defaultdict(lambda: defaultdict(list)))
+    outputs = Parallel(n_jobs=n_jobs)(
+        delayed(_extract_one)(mouse_id, data, parameters)
+        for mouse_id, data in merged_dfs.items()
+    )
+
+    # Accumulate under flat (genotype, phase, syllable) keys: one hash lookup
+    # per append instead of three nested defaultdict hops
+    flat_DS = {}
+    flat_VS = {}
+    for genotype, results in outputs:
+        if genotype is None:
+            continue
+        for injection_phase, per_phase in results.items():
+            for syllable, (ds_block, vs_block) in per_phase.items():
+                key = (genotype, injection_phase, syllable)
+                flat_DS.setdefault(key, []).append(ds_block)
+                flat_VS.setdefault(key, []).append(vs_block)
+
+    # Rebuild the nested layout downstream code indexes into, merging the
+    # per-mouse blocks on the way; a single block is already the final array
+    syllable_snippets_DS = defaultdict(lambda: defaultdict(dict))
+    syllable_snippets_VS = defaultdict(lambda: defaultdict(dict))
+    for flat, nested in ((flat_DS, syllable_snippets_DS), (flat_VS, syllable_snippets_VS)):
+        for (genotype, injection_phase, syllable), blocks in flat.items():
+            nested[genotype][injection_phase][syllable] = \
+                blocks[0] if len(blocks) == 1 else np.concatenate(blocks)
 
-    time_axis = np.arange(-m, n + 1)
+    return syllable_snippets_DS, syllable_snippets_VS
 
-    for mouse_id, df in merged_dfs.items():
-        # Get genotype
-        genotype = str(df['Genotype_syllable'].iloc[0]) if 'Genotype_syllable' in df.columns else 'Unknown'
 
-        df = df.reset_index(drop=True)
-
-        # Ensure required columns are present
-        required_columns = {'DS_470', 'VS_470', 'syllable_0', 'SecFromInjection_fiber'}
-        if not required_columns.issubset(df.columns):
-            print(f"Warning: Required columns missing in DataFrame for Mouse ID {mouse_id}. Skipping.")
-            continue
+class SnippetStore:
+    """
+    Dense struct-of-arrays view of the nested snippet dictionary.
 
-        # Convert 'syllable_0' and 'SecFromInjection_fiber' to numeric
-        df['syllable_0'] = pd.to_numeric(df['syllable_0'], errors='coerce')
-        df['SecFromInjection_fiber'] = pd.to_numeric(df['SecFromInjection_fiber'], errors='coerce')
-
-        # Identify syllable initiations
-        syllable_shift = df['syllable_0'].shift(1)
-        initiations = (df['syllable_0'] != syllable_shift) & (~df['syllable_0'].isna())
-
-        # Define time windows in minutes
-        pre_injection_window_start = -25
-        pre_injection_window_end = -5
-        post_injection_window_start = 10
-        post_injection_window_end = 40
-
-        # Iterate over top syllables (0 to 29)
-        top_syllables = list(range(40))
-        for syllable in top_syllables:
-            # Find initiation indices for the current syllable
-            syllable_initiations = initiations & (df['syllable_0'] == syllable)
-            initiation_indices = syllable_initiations[syllable_initiations].index
-
-            for idx in initiation_indices:
-                # Get the 'SecFromInjection_fiber' value at initiation
-                sec_from_injection = df.at[idx, 'SecFromInjection_fiber']
-
-                # Determine injection phase
-                if pre_injection_window_start <= sec_from_injection <= pre_injection_window_end:
-                    injection_phase = 'pre'
-                elif post_injection_window_start <= sec_from_injection <= post_injection_window_end:
-                    injection_phase = 'post'
-                else:
-                    continue  # Skip syllable initiations outside the time windows
-
-                start_idx = idx - m
-                end_idx = idx + n
-
-                # Check if the window is within DataFrame bounds
-                if start_idx >= 0 and end_idx < len(df):
-                    # Extract signal snippets
-                    snippet_DS = df['DS_470'].iloc[start_idx:end_idx + 1].values
-                    snippet_VS = df['VS_470'].iloc[start_idx:end_idx + 1].values
-
-                    # Apply rolling mean
-                    snippet_DS_rolled = pd.Series(snippet_DS).rolling(window=window_size, min_periods=1).mean().values
-                    snippet_VS_rolled = pd.Series(snippet_VS).rolling(window=window_size, min_periods=1).mean().values
-
-                    # Normalize the signals
-                    normalization_value_DS = snippet_DS_rolled[normalization_frame]
-                    normalization_value_VS = snippet_VS_rolled[normalization_frame]
-
-                    snippet_DS_normalized = snippet_DS_rolled - normalization_value_DS
-                    snippet_VS_normalized = snippet_VS_rolled - normalization_value_VS
-
-                    # Append the normalized snippets to the respective lists
-                    syllable_snippets_DS[genotype][injection_phase][syllable].append(snippet_DS_normalized)
-                    syllable_snippets_VS[genotype][injection_phase][syllable].append(snippet_VS_normalized)
-                else:
-                    continue  # Skip if the window is incomplete
-
-    # After collecting all the snippets:
-    for genotype in syllable_snippets_DS:
-        for injection_phase in syllable_snippets_DS[genotype]:
-            for syllable in syllable_snippets_DS[genotype][injection_phase]:
-                syllable_snippets_DS[genotype][injection_phase][syllable] \
-                    = np.vstack(syllable_snippets_DS[genotype][injection_phase][syllable])
-                syllable_snippets_VS[genotype][injection_phase][syllable] \
-                    = np.vstack(syllable_snippets_VS[genotype][injection_phase][syllable])
+    blocks[g][p][s] holds the (n, T) block for genotype index g, phase index
+    p and syllable s (None when absent), with companion boolean exists and
+    integer counts arrays of shape (G, P, S). Integer indexing replaces the
+    three hash lookups per nested-dict access, and the boolean mask makes
+    emptiness checks branch-free for batch consumers.
+    """
 
-    return syllable_snippets_DS, syllable_snippets_VS
+    def __init__(self, genotypes, phases, n_syllables):
+        self.genotypes = list(genotypes)
+        self.phases = list(phases)
+        self.n_syllables = n_syllables
+        self.blocks = [[[None] * n_syllables for _ in self.phases] for _ in self.genotypes]
+        self.exists = np.zeros((len(self.genotypes), len(self.phases), n_syllables), dtype=bool)
+        self.counts = np.zeros((len(self.genotypes), len(self.phases), n_syllables), dtype=np.int64)
+
+    @classmethod
+    def from_nested(cls, nested, genotypes=('WT', 'IFxDN HET'), phases=('pre', 'post'),
+                    n_syllables=None):
+        if n_syllables is None:
+            n_syllables = 1 + max((syllable
+                                   for per_genotype in nested.values()
+                                   for per_phase in per_genotype.values()
+                                   for syllable in per_phase), default=-1)
+        store = cls(genotypes, phases, n_syllables)
+        for g, genotype in enumerate(store.genotypes):
+            per_genotype = nested.get(genotype, {})
+            for p, phase in enumerate(store.phases):
+                for syllable, block in per_genotype.get(phase, {}).items():
+                    if 0 <= syllable < n_syllables and block.ndim == 2 and block.size > 0:
+                        # float32 is plenty for photometry and halves the
+                        # bandwidth of every downstream reduction; blocks from
+                        # extract_signal_snippets are already float32 (no copy)
+                        store.blocks[g][p][syllable] = block.astype(np.float32, copy=False)
+                        store.exists[g, p, syllable] = True
+                        store.counts[g, p, syllable] = block.shape[0]
+        return store
+
+    def get(self, g, p, s):
+        """Return the block at integer indices (g, p, s), or None."""
+        if 0 <= s < self.n_syllables:
+            return self.blocks[g][p][s]
+        return None
 
 
 def process_snippets(data):
@@ -249,11 +508,62 @@ def process_snippets(data):
         n (int): Number of snippets.
     """
     if data.ndim == 2 and data.size > 0:
-        mean = np.mean(data, axis=0)
-        sem = stats.sem(data, axis=0, nan_policy='omit')
-        t_value = stats.t.ppf(0.975, df=len(data) - 1) if len(data) > 1 else 0
-        ci = sem * t_value
         n = len(data)
+        t_value = stats.t.ppf(0.975, df=n - 1) if n > 1 else 0
+        # The fused kernel doesn't replicate nan_policy='omit', so NaN-bearing
+        # blocks take the scipy path
+        if NUMBA_AVAILABLE and not np.isnan(data).any():
+            mean, sem = _mean_ci_kernel(np.ascontiguousarray(data))
+        else:
+            mean = np.mean(data, axis=0)
+            sem = stats.sem(data, axis=0, nan_policy='omit')
+        ci = sem * t_value
         return mean, ci, n
     else:
         return None, None, 0
+
+
+def process_snippets_batch(snippets_list):
+    """
+    Process several snippet blocks at once with segment reductions.
+
+    Stacks the blocks into one contiguous array and computes every group's
+    mean and confidence interval from two np.add.reduceat passes, instead of
+    dispatching a separate mean/sem reduction per block as process_snippets
+    does.
+
+    Parameters
+    ----------
+    snippets_list : list of np.ndarray
+        List of (n_i, T) snippet blocks. Entries that are empty or not 2D
+        yield (None, None, 0), like process_snippets.
+
+    Returns
+    -------
+    list of tuple
+        One (mean, ci, n) tuple per input block, matching process_snippets.
+    """
+    results = [(None, None, 0)] * len(snippets_list)
+    valid = [(i, s) for i, s in enumerate(snippets_list)
+             if isinstance(s, np.ndarray) and s.ndim == 2 and s.size > 0]
+    if not valid:
+        return results
+
+    counts = np.array([s.shape[0] for _, s in valid], dtype=np.float64)
+    big = np.vstack([s for _, s in valid]).astype(np.float64, copy=False)
+    offsets = np.concatenate(([0], np.cumsum(counts[:-1]))).astype(np.intp)
+
+    sums = np.add.reduceat(big, offsets, axis=0)
+    sqsums = np.add.reduceat(big * big, offsets, axis=0)
+    means = sums / counts[:, None]
+    # Unbiased variance, matching stats.sem's default ddof=1; single-row
+    # groups divide by zero and come out NaN just like stats.sem does
+    with np.errstate(invalid='ignore', divide='ignore'):
+        variances = (sqsums - counts[:, None] * means ** 2) / (counts - 1)[:, None]
+        sems = np.sqrt(variances / counts[:, None])
+
+    for row, (i, _) in enumerate(valid):
+        n = int(counts[row])
+        t_value = stats.t.ppf(0.975, df=n - 1) if n > 1 else 0
+        results[i] = (means[row], sems[row] * t_value, n)
+    return results
@@ -1,9 +1,173 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
 import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import PolyCollection
+from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.figure import Figure
 import os
-from data_processing import process_snippets
+from data_processing import process_snippets_batch, SnippetStore
 import numpy as np
 
-def plot_syllable_signal(syllable, signal_type, syllable_snippets, save_figs=False, output_dir=''):
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+try:
+    import numexpr as ne
+    NUMEXPR_AVAILABLE = True
+except ImportError:
+    NUMEXPR_AVAILABLE = False
+
+
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _mse_kernel(snippets):
+        # One Welford pass per column: each thread streams a single time point
+        # down the snippet axis, so no (N, T) squared-deviation temporary is
+        # ever materialized
+        n, t = snippets.shape
+        total = 0.0
+        for j in prange(t):
+            mean = 0.0
+            m2 = 0.0
+            count = 0.0
+            for i in range(n):
+                count += 1.0
+                delta = snippets[i, j] - mean
+                mean += delta / count
+                m2 += delta * (snippets[i, j] - mean)
+            # population std to match np.std's default ddof=0
+            total += np.sqrt(m2 / count) / np.sqrt(count)
+        return total / t
+
+
+def _mse_numpy(snippets):
+    # Center once and contract the squared deviations with einsum, which maps
+    # to a BLAS-style kernel on the contiguous float32 block and skips the
+    # Python-level np.std/np.var dispatch overhead that dominates at small N
+    n = snippets.shape[0]
+    d = snippets - snippets.mean(axis=0)
+    var = np.einsum('ij,ij->j', d, d) / n
+    k = 1.0 / np.sqrt(n)
+    if NUMEXPR_AVAILABLE:
+        sem = ne.evaluate("sqrt(var) * k")
+    else:
+        sem = np.sqrt(var, out=var)
+        sem *= k
+    return np.mean(sem, dtype=np.float64)
+
+
+# Resolve the implementation once at import; the hot path then makes a plain
+# call instead of branching on availability every invocation
+_mse_impl = _mse_kernel if NUMBA_AVAILABLE else _mse_numpy
+
+_FIG_CACHE = None
+_AGG_FIG_CACHE = None
+
+
+def _make_grid(fig):
+    # Explicit margins known up front replace the tight_layout +
+    # subplots_adjust double pass; tight_layout runs a full draw just to
+    # measure text extents, and the adjusted top overwrote it anyway
+    gs = fig.add_gridspec(2, 2, left=0.08, right=0.97, top=0.88, bottom=0.1,
+                          hspace=0.25, wspace=0.2)
+    axes = np.empty((2, 2), dtype=object)
+    for i in range(2):
+        for j in range(2):
+            share = axes[0, 0] if (i or j) else None
+            axes[i, j] = fig.add_subplot(gs[i, j], sharex=share)
+    # plt.subplots(sharex=True) hid the top row's x tick labels; add_subplot
+    # with sharex does not, so do it explicitly (y labels stay everywhere,
+    # since the baseline never shared y)
+    for ax in axes[0]:
+        ax.xaxis.set_tick_params(labelbottom=False)
+    return axes
+
+
+def _get_figure(fig=None, for_save=False):
+    """
+    Return (fig, axes) for the 2x2 grid, creating and caching it on demand.
+
+    Building the grid (artist construction, tick layout) dominates batch
+    plotting over many syllables, so the default figure is created once at
+    module scope and reused; per-panel artist handles live on the figure as
+    fig._syllable_handles so a caller-supplied figure is reused the same way.
+    Save-only figures are built on a bare Agg canvas, bypassing the pyplot
+    figure manager and its Gcf registry entirely.
+    """
+    global _FIG_CACHE, _AGG_FIG_CACHE
+    if fig is None and for_save:
+        if _AGG_FIG_CACHE is None:
+            fig = Figure(figsize=(12, 8))
+            FigureCanvasAgg(fig)
+            axes = _make_grid(fig)
+            _AGG_FIG_CACHE = (fig, axes)
+        fig, axes = _AGG_FIG_CACHE
+    elif fig is None:
+        # A closed figure (GUI window, or the inline backend's post-cell
+        # close) is gone from Gcf: artists still update but plt.show displays
+        # nothing, so rebuild rather than draw into a dead figure
+        if _FIG_CACHE is not None and not plt.fignum_exists(_FIG_CACHE[0].number):
+            _FIG_CACHE = None
+        if _FIG_CACHE is None:
+            fig = plt.figure(figsize=(12, 8))
+            axes = _make_grid(fig)
+            _FIG_CACHE = (fig, axes)
+        fig, axes = _FIG_CACHE
+    elif fig.axes:
+        axes = np.asarray(fig.axes[:4]).reshape(2, 2)
+    else:
+        axes = _make_grid(fig)
+    if not hasattr(fig, '_syllable_handles'):
+        fig._syllable_handles = {}
+    return fig, axes
+
+
+_ENSURED_DIRS = set()
+
+
+def _ensure_dir(directory):
+    # One makedirs per directory per session instead of a stat per save
+    if directory not in _ENSURED_DIRS:
+        os.makedirs(directory, exist_ok=True)
+        _ENSURED_DIRS.add(directory)
+
+
+def _snip(snippet_dict, genotype, injection_phase, syllable):
+    # Single place for the dict walk and the 2D/non-empty validity check
+    a = snippet_dict.get(genotype, {}).get(injection_phase, {}).get(syllable)
+    if isinstance(a, np.ndarray) and a.ndim == 2 and a.shape[0] > 0:
+        return a
+    return None
+
+
+def _band_verts(x, lo, hi):
+    # Closed polygon for the CI band: forward along the lower edge, back
+    # along the upper one
+    xs = np.concatenate([x, x[::-1]])
+    ys = np.concatenate([lo, hi[::-1]])
+    return [np.column_stack([xs, ys])]
+
+
+_TIME_AXIS_CACHE = {}
+
+
+def _time_axis_for(snippet_length):
+    # Memoize per snippet length; batch loops hit the same length every call
+    axis = _TIME_AXIS_CACHE.get(snippet_length)
+    if axis is None:
+        m = (snippet_length - 1) // 2
+        n = (snippet_length - 1) - m
+        axis = np.arange(-m, n + 1)
+        _TIME_AXIS_CACHE[snippet_length] = axis
+    return axis
+
+
+def plot_syllable_signal(syllable, signal_type, syllable_snippets, save_figs=False, output_dir='', fig=None, time_axis=None):
     """
     Plot average signals with SEM shading for a given syllable and signal type.
 
@@ -13,75 +177,222 @@ def plot_syllable_signal(syllable, signal_type, syllable_snippets, save_figs=Fal
         The syllable index to plot.
     signal_type : str
         Type of photometry signal ('DS' or 'VS').
-    syllable_snippets : defaultdict
-        Nested dictionary containing signal snippets.
+    syllable_snippets : defaultdict or SnippetStore
+        Nested dictionary containing signal snippets, or a SnippetStore
+        built from one; batch loops should pass the store so the dict is
+        traversed only once.
     save_figs : bool, optional
         Whether to save the figures as PNG files. Default is False.
     output_dir : str, optional
         Directory to save figures if save_figs is True. Default is '' (current directory).
+    fig : matplotlib.figure.Figure, optional
+        Figure to draw into. Default is None, which reuses a module-level
+        cached figure so batch loops pay the artist setup cost only once.
+        When a figure is supplied and save_figs is False, showing or saving
+        it is left to the caller.
+    time_axis : np.ndarray, optional
+        Precomputed frame axis. Default is None, which derives it from the
+        snippet length (memoized per length).
 
     Returns
     -------
     None
     """
-    fig, axes = plt.subplots(2, 2, figsize=(12, 8), sharex=True)
-    fig.suptitle(f'Syllable {syllable} - {signal_type}_470 Signal')
+    # Integer indexing into the SoA store replaces the three hash lookups
+    # per panel of the nested dict
+    if isinstance(syllable_snippets, SnippetStore):
+        store = syllable_snippets
+    else:
+        store = SnippetStore.from_nested(syllable_snippets)
+    genotypes = store.genotypes
+    injection_phases = store.phases
+
+    snippet_blocks = [store.get(i, j, syllable)
+                      for i in range(len(genotypes)) for j in range(len(injection_phases))]
+
+    # Sparse syllables are common; skip figure construction when every
+    # panel would be hidden anyway
+    if all(block is None for block in snippet_blocks):
+        return
 
-    genotypes = ['WT', 'IFxDN HET']
-    injection_phases = ['pre', 'post']
+    caller_fig = fig
+    fig, axes = _get_figure(fig, for_save=save_figs)
+    handles = fig._syllable_handles
+
+    # Reuse one suptitle Text across syllables; set_text skips the artist
+    # construction and font-property setup a fresh suptitle call pays
+    suptitle = getattr(fig, '_suptitle_text', None)
+    if suptitle is None:
+        suptitle = fig.suptitle('')
+        fig._suptitle_text = suptitle
+    suptitle.set_text(f'Syllable {syllable} - {signal_type}_470 Signal')
 
     # Define time axis based on snippet length
-    time_axis = np.arange(-150, 151)  # Default values
-    if syllable_snippets:
-        any_genotype = next(iter(syllable_snippets))
-        any_phase = next(iter(syllable_snippets[any_genotype]))
-        any_syllable_snippets = syllable_snippets[any_genotype][any_phase].get(syllable, np.array([]))
-
-        # Check if any_syllable_snippets is a 2D array and not empty
-        if any_syllable_snippets.ndim == 2 and any_syllable_snippets.size > 0:
-            snippet_length = any_syllable_snippets.shape[1]  # Use shape[1] since it's a 2D array
-            m = (snippet_length - 1) // 2
-            n = (snippet_length - 1) - m
-            time_axis = np.arange(-m, n + 1)
+    if time_axis is None:
+        time_axis = _time_axis_for(301)  # Default values
+        for block in snippet_blocks:
+            if block is not None:
+                time_axis = _time_axis_for(block.shape[1])
+                break
+
+    # One batched reduction over all four panels instead of a process_snippets
+    # call per subplot
+    processed = process_snippets_batch(snippet_blocks)
+
+    # Scratch buffers for the band edges, reused across panels and syllables
+    scratch = getattr(fig, '_band_scratch', None)
+    if scratch is None or scratch[0].shape[0] != len(time_axis):
+        scratch = (np.empty(len(time_axis)), np.empty(len(time_axis)))
+        fig._band_scratch = scratch
+    buf_lo, buf_hi = scratch
 
     for i, genotype in enumerate(genotypes):
         for j, injection_phase in enumerate(injection_phases):
-            snippets = syllable_snippets[genotype][injection_phase].get(syllable, np.array([]))
-
-            # Ensure snippets is a 2D array and not empty
-            if snippets.ndim == 2 and snippets.size > 0:
-                mean, ci, n = process_snippets(snippets)
-                ax = axes[i, j]
-                if mean is not None:
-                    color = 'blue' if signal_type == 'DS' else 'darkviolet'
-                    ax.plot(time_axis, mean, label=f'{signal_type}_470', color=color)
-                    ax.fill_between(time_axis, mean - ci, mean + ci, color=color, alpha=0.3)
+            mean, ci, n = processed[i * len(injection_phases) + j]
+            ax = axes[i, j]
+            if mean is not None:
+                ax.set_visible(True)
+                color = 'blue' if signal_type == 'DS' else 'darkviolet'
+                # Write the band edges into the scratch buffers: no fresh
+                # temporaries per panel, and numexpr threads the arithmetic
+                if NUMEXPR_AVAILABLE:
+                    ne.evaluate("mean - ci", out=buf_lo)
+                    ne.evaluate("mean + ci", out=buf_hi)
+                else:
+                    np.subtract(mean, ci, out=buf_lo)
+                    np.add(mean, ci, out=buf_hi)
+                lo, hi = buf_lo, buf_hi
+                if (i, j) in handles:
+                    # Update the existing artists in place; swapping the band's
+                    # vertex array avoids the remove + fill_between churn, and
+                    # the title's set_text skips rebuilding a Text artist
+                    line, fill, title = handles[(i, j)]
+                    line.set_data(time_axis, mean)
+                    line.set_color(color)
+                    fill.set_verts(_band_verts(time_axis, lo, hi))
+                    fill.set_color(color)
+                    title.set_text(f'{genotype}, {injection_phase} injection (n={n})')
+                    # relim only walks lines, so fold the band extent in by hand
+                    ax.relim()
+                    ax.update_datalim([(time_axis[0], np.nanmin(lo)),
+                                       (time_axis[-1], np.nanmax(hi))])
+                    ax.autoscale_view()
+                else:
+                    line, = ax.plot(time_axis, mean, label=f'{signal_type}_470', color=color)
+                    fill = PolyCollection(_band_verts(time_axis, lo, hi), color=color, alpha=0.3)
+                    ax.add_collection(fill)
                     ax.axvline(0, color='gray', linestyle='--')
-                    ax.set_title(f'{genotype}, {injection_phase} injection (n={n})')
+                    title = ax.set_title(f'{genotype}, {injection_phase} injection (n={n})')
                     ax.set_ylabel('Signal (Normalized)')
                     if i == 1:
                         ax.set_xlabel('Frames Relative to Initiation')
-                else:
-                    ax.set_visible(False)
+                    handles[(i, j)] = (line, fill, title)
             else:
-                axes[i, j].set_visible(False)  # Hide axes if there are no snippets
-
-    # Adjust the layout
-    plt.tight_layout()
-    fig.subplots_adjust(top=0.88)
+                ax.set_visible(False)  # Hide axes if there are no snippets
 
     if save_figs:
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
+        _ensure_dir(output_dir)
         # Construct a unique filename based on syllable and signal type
-        filename = f'syllable_{syllable}_{signal_type}.png'
-        filepath = os.path.join(output_dir, filename)
-        plt.savefig(filepath)
-        plt.close()  # Close the figure to free memory
-    else:
+        filepath = os.path.join(output_dir, f'syllable_{syllable}_{signal_type}.png')
+        # print_png renders straight through the Agg canvas, with no pyplot
+        # dispatch and no tight-bbox re-render
+        if hasattr(fig.canvas, 'print_png'):
+            fig.canvas.print_png(filepath)
+        else:
+            fig.savefig(filepath)
+    elif caller_fig is None:
         plt.show()
 
 
+_WORKER_STORE = None
+
+
+def _init_plot_worker(store):
+    # Workers render off-screen; the store crosses the process boundary once
+    # per worker here instead of once per submitted syllable
+    import matplotlib
+    matplotlib.use('Agg')
+    global _WORKER_STORE
+    _WORKER_STORE = store
+
+
+def _plot_one(syllable, signal_type, output_dir):
+    plot_syllable_signal(syllable, signal_type, _WORKER_STORE,
+                         save_figs=True, output_dir=output_dir)
+
+
+def plot_all_syllables(syllables, signal_type, syllable_snippets, output_dir, workers=None):
+    """
+    Save figures for many syllables in parallel worker processes.
+
+    Each syllable's figure is independent, so the batch scales with core
+    count. Workers run on the Agg backend and receive the SnippetStore once
+    at pool start via the initializer rather than with every task.
+
+    Parameters
+    ----------
+    syllables : iterable of int
+        Syllable indices to plot.
+    signal_type : str
+        Type of photometry signal ('DS' or 'VS').
+    syllable_snippets : defaultdict or SnippetStore
+        Nested dictionary containing signal snippets, or a SnippetStore.
+    output_dir : str
+        Directory the PNGs are saved into.
+    workers : int, optional
+        Number of worker processes. Default is None (one per core).
+
+    Returns
+    -------
+    None
+    """
+    if not isinstance(syllable_snippets, SnippetStore):
+        syllable_snippets = SnippetStore.from_nested(syllable_snippets)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_plot_worker,
+                             initargs=(syllable_snippets,)) as executor:
+        list(executor.map(partial(_plot_one, signal_type=signal_type, output_dir=output_dir),
+                          syllables))
+
+
+def plot_syllable_signal_batch(syllables, signal_type, syllable_snippets, output_pdf):
+    """
+    Render many syllables into a single multi-page PDF.
+
+    One page per syllable, drawn into the cached off-screen figure and saved
+    through a shared PdfPages handle, so the renderer reuses its font and
+    glyph caches across pages and no per-syllable PNG encode happens.
+
+    Parameters
+    ----------
+    syllables : iterable of int
+        Syllable indices, one page each.
+    signal_type : str
+        Type of photometry signal ('DS' or 'VS').
+    syllable_snippets : defaultdict or SnippetStore
+        Nested dictionary containing signal snippets, or a SnippetStore.
+    output_pdf : str
+        Path of the PDF file to write.
+
+    Returns
+    -------
+    None
+    """
+    if not isinstance(syllable_snippets, SnippetStore):
+        syllable_snippets = SnippetStore.from_nested(syllable_snippets)
+
+    fig, _ = _get_figure(for_save=True)
+    with PdfPages(output_pdf) as pdf:
+        for syllable in syllables:
+            # Skip pages that plot_syllable_signal would early-return on,
+            # so the previous page is not saved twice
+            if (syllable >= syllable_snippets.n_syllables
+                    or not syllable_snippets.exists[:, :, syllable].any()):
+                continue
+            plot_syllable_signal(syllable, signal_type, syllable_snippets, fig=fig)
+            pdf.savefig(fig)
+
+
 def mse_syllable_snippet(syllable_snippets, genotype, injection_phase, syllable):
     """
     Calculate the Mean Standard Error (MSE) for a specified genotype, injection phase, and syllable
@@ -102,21 +413,14 @@ def mse_syllable_snippet(syllable_snippets, genotype, injection_phase, syllable)
     -------
     mse : float
         Mean Standard Error of the signal snippets, representing overall certainty.
+        The per-point reduction runs in float32 — ample for photometry signals
+        and half the memory traffic — while the final scalar mean is taken in
+        float64 to avoid roundoff across time points.
     """
     # Access the array for the specific genotype, injection phase, and syllable
-    snippets = syllable_snippets.get(genotype, {}).get(injection_phase, {}).get(syllable, np.array([]))
-
-    # Ensure snippets is a 2D array and has data
-    if snippets.ndim != 2 or snippets.size == 0:
+    snippets = _snip(syllable_snippets, genotype, injection_phase, syllable)
+    if snippets is None:
         return None  # Return None if there are no snippets or they are not in the expected 2D format
 
-    # Calculate standard deviation across snippets at each time point
-    std_dev = np.std(snippets, axis=0)
-    
-    # Calculate standard error at each time point
-    sem = std_dev / np.sqrt(snippets.shape[0])
-    
-    # Mean Standard Error (MSE) across all time points
-    mse = np.mean(sem)
-
-    return mse
\ No newline at end of file
+    snippets = np.ascontiguousarray(snippets, dtype=np.float32)
+    return float(_mse_impl(snippets))
\ No newline at end of file